@@ -1,11 +1,41 @@
 import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import re
+import typing as T
+
+from ass_parser import AssEvent
 
 from bubblesub.api import Api
 from bubblesub.api.cmd import BaseCommand
 from bubblesub.cfg.menu import MenuCommand
 from bubblesub.cmd.common import SubtitlesSelection
 
-from .process import ProcessingError, convert_to_smart_quotes, fix_text
+from .process import (
+    CacheInfo,
+    ProcessingError,
+    StyleKey,
+    cache_fix_texts,
+    convert_to_smart_quotes,
+    find_smart_quotes,
+    fix_text,
+    fix_text_cache_clear,
+    fix_text_cache_info,
+    fix_texts,
+    get_cached_fix_texts,
+    get_style_key,
+)
+from .rules import Rule, RuleSet
+
+BULK_CHUNK_SIZE = 500
+
+
+def divide_into_groups(
+    source: T.Sequence[T.Any], size: int
+) -> T.Iterable[T.Sequence[T.Any]]:
+    size = max(1, size)
+    return (source[i : i + size] for i in range(0, len(source), size))
 
 
 class CleanCommand(BaseCommand):
@@ -26,11 +56,39 @@ class CleanCommand(BaseCommand):
             default="selected",
         )
 
+        parser.add_argument(
+            "-b",
+            "--bulk",
+            help="process the subtitles in background worker processes",
+            action="store_true",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="number of worker processes to use in bulk mode",
+            type=int,
+        )
+
+        parser.add_argument(
+            "-nc",
+            action="store_true",
+            dest="clear_cache",
+            help="clear cache of already cleaned lines",
+        )
+
         parser.add_argument(
             "--smart-quotes",
             help="replace plain quotation marks with smart ones",
             action="store_true",
         )
+        parser.add_argument(
+            "--check-smart-quotes",
+            help=(
+                "only list quotation marks that --smart-quotes would "
+                "replace, without changing anything"
+            ),
+            action="store_true",
+        )
 
         parser.add_argument(
             "--opening-quotation-mark",
@@ -42,30 +100,160 @@ class CleanCommand(BaseCommand):
         )
 
     async def run(self):
+        if self.args.clear_cache:
+            fix_text_cache_clear()
+
+        try:
+            rules = self.get_user_rules()
+        except (TypeError, re.error) as ex:
+            self.api.log.error(f"invalid plugins.clean_rules option ({ex})")
+            return
+
+        subtitles = await self.args.target.get_subtitles()
+
+        if self.args.check_smart_quotes:
+            self.check_smart_quotes(subtitles)
+            return
+
+        if self.args.bulk:
+            cache_info = fix_text_cache_info()
+            texts = await self.fix_texts_in_background(subtitles, rules)
+            with self.api.undo.capture():
+                changed = 0
+                for sub, (old_text, new_text) in zip(subtitles, texts):
+                    # don't clobber lines edited while the workers were busy
+                    if sub.text == old_text and new_text != old_text:
+                        sub.text = new_text
+                        changed += 1
+                self.api.log.info(f"fixed {changed} lines text")
+                self.log_cache_info(cache_info)
+                self.fix_smart_quotes(subtitles)
+            return
+
         changed = 0
+        cache_info = fix_text_cache_info()
 
         with self.api.undo.capture():
-            subtitles = await self.args.target.get_subtitles()
-
             for sub in subtitles:
                 style = self.api.subs.styles.get_by_name(sub.style_name)
-                text = fix_text(sub.text, style)
+                text = fix_text(sub.text, style, rules)
                 if text != sub.text:
                     sub.text = text
                     changed += 1
 
             self.api.log.info(f"fixed {changed} lines text")
+            self.log_cache_info(cache_info)
+            self.fix_smart_quotes(subtitles)
+
+    def get_user_rules(self) -> T.Optional[RuleSet]:
+        # list of {pattern: ..., replacement: ..., regex: true/false}
+        user_rules = self.api.cfg.opt.get("plugins", {}).get("clean_rules")
+        if not user_rules:
+            return None
+        # a single scan however many rules there are; they all see the text
+        # as it was before any of them ran
+        return RuleSet(
+            (Rule(**user_rule) for user_rule in user_rules), single_scan=True
+        )
+
+    async def fix_texts_in_background(
+        self, subtitles: T.List[AssEvent], rules: T.Optional[RuleSet]
+    ) -> T.List[T.Tuple[str, str]]:
+        style_keys: T.Dict[str, StyleKey] = {}
+        items: T.List[T.Tuple[str, StyleKey]] = []
+        for sub in subtitles:
+            if sub.style_name not in style_keys:
+                style_keys[sub.style_name] = get_style_key(
+                    self.api.subs.styles.get_by_name(sub.style_name)
+                )
+            items.append((sub.text, style_keys[sub.style_name]))
+
+        # only send the workers what isn't in the cache already
+        unique_items = list(dict.fromkeys(items))
+        fixed_texts = dict(
+            zip(unique_items, get_cached_fix_texts(unique_items, rules))
+        )
+        missing_items = [
+            item for item, text in fixed_texts.items() if text is None
+        ]
 
-            if self.args.smart_quotes:
-                try:
-                    changed = convert_to_smart_quotes(
-                        subtitles,
-                        self.args.opening_quotation_mark,
-                        self.args.closing_quotation_mark,
+        loop = asyncio.get_event_loop()
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.args.jobs
+        )
+
+        async def fix_group(
+            group: T.Sequence[T.Tuple[str, StyleKey]],
+        ) -> T.Tuple[T.Sequence[T.Tuple[str, StyleKey]], T.List[str]]:
+            return group, await loop.run_in_executor(
+                executor, fix_texts, group, rules
+            )
+
+        done = len(unique_items) - len(missing_items)
+        try:
+            for future in asyncio.as_completed(
+                [
+                    fix_group(group)
+                    for group in divide_into_groups(
+                        missing_items, BULK_CHUNK_SIZE
                     )
-                    self.api.log.info(f"fixed {changed} lines quotes")
-                except ProcessingError as ex:
-                    self.api.log.error(str(ex))
+                ]
+            ):
+                group, texts = await future
+                # the worker caches go away along with the pool
+                cache_fix_texts(group, rules, texts)
+                fixed_texts.update(zip(group, texts))
+                done += len(texts)
+                self.api.log.info(
+                    f"cleaned {done}/{len(unique_items)} lines..."
+                )
+        finally:
+            # drop the groups that haven't started if the command got
+            # cancelled
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return [
+            (text, fixed_texts[(text, style_key)]) for text, style_key in items
+        ]
+
+    def log_cache_info(self, old_cache_info: CacheInfo) -> None:
+        cache_info = fix_text_cache_info()
+        self.api.log.info(
+            f"cache: {cache_info.hits - old_cache_info.hits} hits, "
+            f"{cache_info.misses - old_cache_info.misses} misses, "
+            f"{cache_info.currsize}/{cache_info.maxsize} lines"
+        )
+
+    def check_smart_quotes(self, subtitles: T.List[AssEvent]) -> None:
+        try:
+            spans = find_smart_quotes(
+                subtitles,
+                self.args.opening_quotation_mark,
+                self.args.closing_quotation_mark,
+            )
+        except ProcessingError as ex:
+            self.api.log.error(str(ex))
+            return
+
+        for i, group in itertools.groupby(spans, key=lambda span: span[0]):
+            offsets = ", ".join(str(offset) for _i, offset in group)
+            self.api.log.info(
+                f"line #{subtitles[i].number}: quotes at {offsets}"
+            )
+        self.api.log.info(f"{len(spans)} quotes to replace")
+
+    def fix_smart_quotes(self, subtitles: T.List[AssEvent]) -> None:
+        if not self.args.smart_quotes:
+            return
+        try:
+            changed = convert_to_smart_quotes(
+                subtitles,
+                self.args.opening_quotation_mark,
+                self.args.closing_quotation_mark,
+            )
+            self.api.log.info(f"fixed {changed} lines quotes")
+        except ProcessingError as ex:
+            self.api.log.error(str(ex))
 
 
 COMMANDS = [CleanCommand]
@@ -0,0 +1,138 @@
+# Benchmarks for the text fixers, kept out of the regular test run. Save a
+# baseline once, then compare later runs against it:
+#
+#   pytest clean/bench_process.py --benchmark-autosave
+#   pytest clean/bench_process.py --benchmark-compare \
+#       --benchmark-compare-fail=mean:10%
+import functools
+import random
+import typing as T
+
+import pytest
+from ass_parser import AssEvent, AssStyle
+
+from .process import (
+    find_smart_quotes,
+    fix_bad_dialogue_dashes,
+    fix_dangling_ass_tags,
+    fix_disjoint_ass_tags,
+    fix_punctuation,
+    fix_text,
+    fix_text_cache_clear,
+    fix_useless_ass_tags,
+    fix_whitespace,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+CORPUS_SIZES = [1_000, 10_000, 100_000]
+WORDS = (
+    "I you we they it this that what why no yes really wait come on "
+    "let's go home now here there never always again sorry thanks "
+    "okay huh eh right well just don't can't won't"
+).split()
+TAGS = [
+    "{\\i1}",
+    "{\\i0}",
+    "{\\b1}",
+    "{\\b0}",
+    "{\\an8}",
+    "{\\pos(640,50)}",
+    "{\\fad(200,200)}",
+    "{\\k0}",
+    "{\\k25}",
+    "{\\i1}{\\i1}",
+    "{TL note: pun}",
+]
+STYLE = AssStyle(name="Default", italic=False, bold=False, alignment=2)
+
+
+def generate_line(rng: random.Random) -> str:
+    parts: T.List[str] = []
+    for _ in range(rng.choice([1, 1, 1, 2])):
+        words = rng.choices(WORDS, k=rng.randint(2, 9))
+        if rng.random() < 0.1:
+            words[0] = "- " + words[0]
+        if rng.random() < 0.1:
+            words[-1] += "..."
+        elif rng.random() < 0.1:
+            words[-1] = '"' + words[-1] + '"'
+        for word in words:
+            if rng.random() < 0.05:
+                parts.append(rng.choice(TAGS))
+            parts.append(word + rng.choice([" ", " ", " ", "  "]))
+        parts.append("\\N")
+    text = "".join(parts[:-1])
+    if rng.random() < 0.2:
+        text = rng.choice(TAGS) + text
+    if rng.random() < 0.05:
+        text += "{\\i0}"
+    if rng.random() < 0.01:
+        # broken tag lists that force the fallbacks
+        text = text.replace("}", "", 1) if "}" in text else "{" + text
+    return text
+
+
+@functools.lru_cache(maxsize=None)
+def get_corpus(size: int) -> T.Tuple[str, ...]:
+    rng = random.Random(size)
+    return tuple(generate_line(rng) for _ in range(size))
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+@pytest.mark.parametrize(
+    "fixer",
+    [
+        fix_disjoint_ass_tags,
+        fix_dangling_ass_tags,
+        fix_useless_ass_tags,
+        fix_bad_dialogue_dashes,
+        fix_whitespace,
+        fix_punctuation,
+    ],
+)
+def test_fixer(
+    benchmark: T.Any, fixer: T.Callable[[str], str], size: int
+) -> None:
+    corpus = get_corpus(size)
+    benchmark.group = f"{size} events"
+    benchmark.pedantic(
+        lambda: [fixer(text) for text in corpus], rounds=3, warmup_rounds=1
+    )
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_fix_text(benchmark: T.Any, size: int) -> None:
+    corpus = get_corpus(size)
+    benchmark.group = f"{size} events"
+    benchmark.pedantic(
+        lambda: [fix_text(text, STYLE) for text in corpus],
+        setup=fix_text_cache_clear,
+        rounds=3,
+    )
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_fix_text_cached(benchmark: T.Any, size: int) -> None:
+    corpus = get_corpus(size)
+    fix_text_cache_clear()
+    for text in corpus:
+        fix_text(text, STYLE)
+    benchmark.group = f"{size} events"
+    benchmark.pedantic(
+        lambda: [fix_text(text, STYLE) for text in corpus], rounds=3
+    )
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_find_smart_quotes(benchmark: T.Any, size: int) -> None:
+    events = [AssEvent(text=text) for text in get_corpus(size)]
+    benchmark.group = f"{size} events"
+    benchmark.pedantic(
+        lambda: find_smart_quotes(
+            events,
+            "\N{LEFT DOUBLE QUOTATION MARK}",
+            "\N{RIGHT DOUBLE QUOTATION MARK}",
+        ),
+        rounds=3,
+    )
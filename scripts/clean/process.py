@@ -1,20 +1,125 @@
+import collections
+import itertools
 import re
 import typing as T
 
 import ass_tag_parser
 from ass_parser import AssEvent, AssStyle
 
+from .rules import Rule, RuleSet
+
+FIX_TEXT_CACHE_SIZE = 100_000
+QUOTE_REGEX = re.compile('["„“”]')
+
+UNESCAPE_LINE_BREAK_RULES = RuleSet([Rule("\\N", "\n"), Rule("\\n", "\n")])
+ESCAPE_LINE_BREAK_RULES = RuleSet([Rule("\n", "\\N")])
+DISJOINT_ASS_TAGS_RULES = RuleSet([Rule("}{", "")])
+DANGLING_ASS_TAGS_RULES = RuleSet([Rule(r"{\\[bius][01]?}$", "", regex=True)])
+PUNCTUATION_RULES = RuleSet(
+    [
+        Rule("...", "\N{HORIZONTAL ELLIPSIS}"),
+        Rule(
+            "\N{HORIZONTAL ELLIPSIS}\\.+",
+            "\N{HORIZONTAL ELLIPSIS}",
+            regex=True,
+        ),
+    ]
+)
+
+# text-level rules run around the tag-aware fixes
+PRE_PARSE_RULES = (
+    UNESCAPE_LINE_BREAK_RULES
+    + DISJOINT_ASS_TAGS_RULES
+    + DANGLING_ASS_TAGS_RULES
+)
+POST_PARSE_RULES = PUNCTUATION_RULES + ESCAPE_LINE_BREAK_RULES
+
 
 class ProcessingError(Exception):
     pass
 
 
+class CacheInfo(T.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache:
+    # unlike functools.lru_cache, can be looked up without computing the
+    # missing values and filled with values computed elsewhere, such as in
+    # the bulk mode worker processes
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "collections.OrderedDict[T.Hashable, T.Any]" = (
+            collections.OrderedDict()
+        )
+
+    def get(self, key: T.Hashable) -> T.Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: T.Hashable, value: T.Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class StyleKey(T.NamedTuple):
+    italic: T.Optional[bool] = None
+    bold: T.Optional[bool] = None
+    alignment: T.Optional[int] = None
+
+
+def get_style_key(style: T.Optional[AssStyle]) -> StyleKey:
+    if style is None:
+        return StyleKey()
+    return StyleKey(
+        italic=style.italic, bold=style.bold, alignment=style.alignment
+    )
+
+
 def fix_disjoint_ass_tags(text: str) -> str:
-    return text.replace("}{", "")
+    return DISJOINT_ASS_TAGS_RULES.apply(text)
 
 
 def fix_dangling_ass_tags(text: str) -> str:
-    return re.sub(r"{\\[bius][01]?}$", "", text)
+    return DANGLING_ASS_TAGS_RULES.apply(text)
+
+
+def _fix_bad_dialogue_dashes_fallback(text: str) -> str:
+    return re.sub("^- ", "\N{EN DASH} ", text, flags=re.M)
+
+
+def _fix_bad_dialogue_dashes(ass_line: T.List[ass_tag_parser.AssItem]) -> None:
+    plain_text_so_far = ""
+    for item in ass_line:
+        if isinstance(item, ass_tag_parser.AssText):
+            if item.text.startswith("- ") and (
+                plain_text_so_far.endswith("\n") or not plain_text_so_far
+            ):
+                item.text = re.sub(
+                    "^- ", "\N{EN DASH} ", item.text, flags=re.M
+                )
+            plain_text_so_far += item.text
 
 
 def fix_bad_dialogue_dashes(text: str) -> str:
@@ -22,87 +127,111 @@ def fix_bad_dialogue_dashes(text: str) -> str:
         ass_line = ass_tag_parser.parse_ass(text)
     except ass_tag_parser.ParseError:
         # dumb replace
-        return re.sub("^- ", "\N{EN DASH} ", text, flags=re.M)
-    else:
-        plain_text_so_far = ""
-        ret = ""
-        for item in ass_line:
-            chunk = item.meta.text
-            if isinstance(item, ass_tag_parser.AssText):
-                if chunk.startswith("- ") and (
-                    plain_text_so_far.endswith("\n") or not plain_text_so_far
-                ):
-                    chunk = re.sub("^- ", "\N{EN DASH} ", chunk, flags=re.M)
-                plain_text_so_far += chunk
-            ret += chunk
-        return ret
+        return _fix_bad_dialogue_dashes_fallback(text)
+    _fix_bad_dialogue_dashes(ass_line)
+    ret = ""
+    for item in ass_line:
+        if isinstance(item, ass_tag_parser.AssText):
+            ret += item.text
+        else:
+            ret += item.meta.text
+    return ret
 
 
-def fix_useless_ass_tags(text: str, style: T.Optional[AssStyle] = None) -> str:
+def _remove_useless_ass_tags(
+    ass_line: T.Iterable[ass_tag_parser.AssItem],
+    style_key: StyleKey,
+) -> T.List[ass_tag_parser.AssItem]:
+    ret: T.List[ass_tag_parser.AssItem] = []
+    last_italic = style_key.italic
+    last_bold = style_key.bold, None
+    last_alignment = style_key.alignment
+    for item in ass_line:
+        if isinstance(item, ass_tag_parser.AssTagItalic):
+            if last_italic == item.enabled:
+                continue
+            last_italic = item.enabled
+        elif isinstance(item, ass_tag_parser.AssTagBold):
+            if last_bold == (item.enabled, item.weight):
+                continue
+            last_bold = item.enabled, item.weight
+        elif isinstance(item, ass_tag_parser.AssTagAlignment):
+            if last_alignment == item.alignment:
+                continue
+            last_alignment = item.alignment
+        elif (
+            isinstance(item, ass_tag_parser.AssTagKaraoke)
+            and item.duration == 0
+        ):
+            continue
+        ret.append(item)
+    return ret
+
+
+def _fix_useless_ass_tags(text: str, style_key: StyleKey) -> str:
     try:
         ass_line = ass_tag_parser.parse_ass(text)
     except ass_tag_parser.ParseError:
         return text
+    return ass_tag_parser.compose_ass(
+        _remove_useless_ass_tags(ass_line, style_key)
+    )
 
-    def remove_useless_italics(
-        ass_line: T.Iterable[ass_tag_parser.AssItem],
-    ) -> T.Iterable[ass_tag_parser.AssItem]:
-        last_state = style.italic if style else None
-        for item in ass_line:
-            if isinstance(item, ass_tag_parser.AssTagItalic):
-                if last_state == item.enabled:
-                    continue
-                last_state = item.enabled
-            yield item
-
-    def remove_useless_bold(
-        ass_line: T.Iterable[ass_tag_parser.AssItem],
-    ) -> T.Iterable[ass_tag_parser.AssItem]:
-        last_state = (style.bold if style else None), None
-        for item in ass_line:
-            if isinstance(item, ass_tag_parser.AssTagBold):
-                if last_state == (item.enabled, item.weight):
-                    continue
-                last_state = item.enabled, item.weight
-            yield item
-
-    def remove_useless_alignment(
-        ass_line: T.Iterable[ass_tag_parser.AssItem],
-    ) -> T.Iterable[ass_tag_parser.AssItem]:
-        last_state = style.alignment if style else None
-        for item in ass_line:
-            if isinstance(item, ass_tag_parser.AssTagAlignment):
-                if last_state == item.alignment:
-                    continue
-                last_state = item.alignment
-            yield item
-
-    def remove_useless_karaoke(
-        ass_line: T.Iterable[ass_tag_parser.AssItem],
-    ) -> T.Iterable[ass_tag_parser.AssItem]:
-        for item in ass_line:
-            if (
-                isinstance(item, ass_tag_parser.AssTagKaraoke)
-                and item.duration == 0
-            ):
-                continue
-            yield item
 
-    ass_line = remove_useless_italics(ass_line)
-    ass_line = remove_useless_bold(ass_line)
-    ass_line = remove_useless_alignment(ass_line)
-    ass_line = remove_useless_karaoke(ass_line)
+def fix_useless_ass_tags(text: str, style: T.Optional[AssStyle] = None) -> str:
+    return _fix_useless_ass_tags(text, get_style_key(style))
 
-    return ass_tag_parser.compose_ass(ass_line)
 
+def _merge_ass_text(
+    ass_line: T.Iterable[ass_tag_parser.AssItem],
+) -> T.List[ass_tag_parser.AssItem]:
+    # emulate what parse_ass(compose_ass(ass_line)) would produce: tag list
+    # braces get reinserted around the tags, so texts that were separated
+    # only by a now empty tag list become a single text
+    ret: T.List[ass_tag_parser.AssItem] = []
+    for item in ass_line:
+        if isinstance(
+            item,
+            (
+                ass_tag_parser.AssTagListOpening,
+                ass_tag_parser.AssTagListEnding,
+            ),
+        ):
+            continue
+        if (
+            isinstance(item, ass_tag_parser.AssText)
+            and ret
+            and isinstance(ret[-1], ass_tag_parser.AssText)
+        ):
+            ret[-1] = ass_tag_parser.AssText(ret[-1].text + item.text)
+            continue
+        ret.append(item)
+    return ret
 
-def fix_whitespace(text: str) -> str:
-    try:
-        ass_line = ass_tag_parser.parse_ass(text)
-    except ass_tag_parser.ParseError:
-        # dumb replace
-        return re.sub(" *\n *", "\n", text.strip(), flags=re.M)
 
+def _survives_round_trip(ass_line: T.List[ass_tag_parser.AssItem]) -> bool:
+    # compose_ass mangles drawings and glues comments onto the arguments of
+    # preceding tags, so such lines need to be reparsed after each fix
+    prev_item: T.Optional[ass_tag_parser.AssItem] = None
+    for item in ass_line:
+        if isinstance(item, ass_tag_parser.AssTagDraw):
+            return False
+        if (
+            isinstance(item, ass_tag_parser.AssTagComment)
+            and not item.text.startswith("\\")
+            and isinstance(prev_item, ass_tag_parser.AssTag)
+            and not isinstance(prev_item, ass_tag_parser.AssTagComment)
+        ):
+            return False
+        prev_item = item
+    return True
+
+
+def _fix_whitespace_fallback(text: str) -> str:
+    return re.sub(" *\n *", "\n", text.strip(), flags=re.M)
+
+
+def _fix_whitespace(ass_line: T.List[ass_tag_parser.AssItem]) -> None:
     for item in ass_line:
         if isinstance(item, ass_tag_parser.AssText):
             item.text = item.text.lstrip()
@@ -114,51 +243,152 @@ def fix_whitespace(text: str) -> str:
     for item in ass_line:
         if isinstance(item, ass_tag_parser.AssText):
             item.text = re.sub(" *\n *", "\n", item.text, flags=re.M)
+
+
+def fix_whitespace(text: str) -> str:
+    try:
+        ass_line = ass_tag_parser.parse_ass(text)
+    except ass_tag_parser.ParseError:
+        # dumb replace
+        return _fix_whitespace_fallback(text)
+    _fix_whitespace(ass_line)
     return ass_tag_parser.compose_ass(ass_line)
 
 
 def fix_punctuation(text: str) -> str:
-    text = text.replace("...", "\N{HORIZONTAL ELLIPSIS}")
-    text = re.sub(
-        "\N{HORIZONTAL ELLIPSIS}\\.+", "\N{HORIZONTAL ELLIPSIS}", text
-    )
-    return text
+    return PUNCTUATION_RULES.apply(text)
 
 
-def fix_text(text: str, style: T.Optional[AssStyle] = None) -> str:
-    text = text.replace("\\N", "\n")
-    text = text.replace("\\n", "\n")
+def _fix_text_uncached(
+    text: str, style_key: StyleKey, rules: T.Optional[RuleSet]
+) -> str:
+    text = PRE_PARSE_RULES.apply(text)
 
-    text = fix_disjoint_ass_tags(text)
-    text = fix_dangling_ass_tags(text)
-    text = fix_useless_ass_tags(text, style)
-    text = fix_bad_dialogue_dashes(text)
-    text = fix_whitespace(text)
-    text = fix_punctuation(text)
+    # parse once and run the tag-aware fixes as passes over the same list
+    try:
+        ass_line = ass_tag_parser.parse_ass(text)
+    except ass_tag_parser.ParseError:
+        text = _fix_bad_dialogue_dashes_fallback(text)
+        text = _fix_whitespace_fallback(text)
+    else:
+        ass_line = _merge_ass_text(
+            _remove_useless_ass_tags(ass_line, style_key)
+        )
+        if _survives_round_trip(ass_line):
+            _fix_bad_dialogue_dashes(ass_line)
+            _fix_whitespace(ass_line)
+            text = ass_tag_parser.compose_ass(ass_line)
+        else:
+            text = _fix_useless_ass_tags(text, style_key)
+            text = fix_bad_dialogue_dashes(text)
+            text = fix_whitespace(text)
 
-    text = text.replace("\n", "\\N")
+    text = POST_PARSE_RULES.apply(text)
+    if rules is not None:
+        text = rules.apply(text)
     return text
 
 
-def convert_to_smart_quotes(
+_FIX_TEXT_CACHE = LRUCache(FIX_TEXT_CACHE_SIZE)
+
+
+def _fix_text(
+    text: str, style_key: StyleKey, rules: T.Optional[RuleSet]
+) -> str:
+    key = (text, style_key, rules)
+    result = _FIX_TEXT_CACHE.get(key)
+    if result is None:
+        result = _fix_text_uncached(text, style_key, rules)
+        _FIX_TEXT_CACHE.put(key, result)
+    return result
+
+
+def fix_text(
+    text: str,
+    style: T.Optional[AssStyle] = None,
+    rules: T.Optional[RuleSet] = None,
+) -> str:
+    return _fix_text(text, get_style_key(style), rules)
+
+
+def fix_texts(
+    items: T.Iterable[T.Tuple[str, StyleKey]],
+    rules: T.Optional[RuleSet] = None,
+) -> T.List[str]:
+    return [_fix_text(text, style_key, rules) for text, style_key in items]
+
+
+def get_cached_fix_texts(
+    items: T.Iterable[T.Tuple[str, StyleKey]],
+    rules: T.Optional[RuleSet] = None,
+) -> T.List[T.Optional[str]]:
+    # None for the texts that still need to be fixed
+    return [
+        _FIX_TEXT_CACHE.get((text, style_key, rules))
+        for text, style_key in items
+    ]
+
+
+def cache_fix_texts(
+    items: T.Iterable[T.Tuple[str, StyleKey]],
+    rules: T.Optional[RuleSet],
+    fixed_texts: T.Iterable[str],
+) -> None:
+    for (text, style_key), fixed_text in zip(items, fixed_texts):
+        _FIX_TEXT_CACHE.put((text, style_key, rules), fixed_text)
+
+
+def fix_text_cache_info() -> CacheInfo:
+    return _FIX_TEXT_CACHE.info()
+
+
+def fix_text_cache_clear() -> None:
+    _FIX_TEXT_CACHE.clear()
+
+
+def _get_smart_quote_replacements(
     events: T.List[AssEvent], opening_mark: str, closing_mark: str
-) -> int:
-    count = 0
-    for event in events:
-        count += len(re.findall('["„“”]', event.text))
-    if count % 2 != 0:
+) -> T.List[T.Tuple[int, int, str]]:
+    ret: T.List[T.Tuple[int, int, str]] = []
+    opening = True
+    for i, event in enumerate(events):
+        for match in QUOTE_REGEX.finditer(event.text):
+            new_quote = opening_mark if opening else closing_mark
+            opening = not opening
+            if match.group() != new_quote:
+                ret.append((i, match.start(), new_quote))
+    if not opening:
         raise ProcessingError("uneven double quotation mark count")
+    return ret
+
+
+def find_smart_quotes(
+    events: T.List[AssEvent], opening_mark: str, closing_mark: str
+) -> T.List[T.Tuple[int, int]]:
+    return [
+        (i, offset)
+        for i, offset, _new_quote in _get_smart_quote_replacements(
+            events, opening_mark, closing_mark
+        )
+    ]
 
+
+def convert_to_smart_quotes(
+    events: T.List[AssEvent], opening_mark: str, closing_mark: str
+) -> int:
     count = 0
-    opening = False
-    for event in events:
-        text = event.text
-        matches = re.finditer('[„”“"]', text)
-        for match in matches:
-            new_quote = opening_mark if opening == 0 else closing_mark
-            opening = not opening
-            text = text[: match.start()] + new_quote + text[match.end() :]
-        if event.text != text:
-            event.text = text
-            count += 1
+    for i, replacements in itertools.groupby(
+        _get_smart_quote_replacements(events, opening_mark, closing_mark),
+        key=lambda replacement: replacement[0],
+    ):
+        text = events[i].text
+        chunks: T.List[str] = []
+        pos = 0
+        for _i, offset, new_quote in replacements:
+            chunks.append(text[pos:offset])
+            chunks.append(new_quote)
+            pos = offset + 1
+        chunks.append(text[pos:])
+        events[i].text = "".join(chunks)
+        count += 1
     return count
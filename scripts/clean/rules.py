@@ -0,0 +1,111 @@
+import functools
+import itertools
+import re
+import typing as T
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Rule:
+    pattern: str
+    replacement: str
+    regex: bool = False
+
+
+def _compile_literal_rule(rule: Rule) -> T.Callable[[str], str]:
+    def apply(text: str) -> str:
+        return text.replace(rule.pattern, rule.replacement)
+
+    return apply
+
+
+def _compile_combined_rules(rules: T.List[Rule]) -> T.Callable[[str], str]:
+    if len(rules) == 1:
+        if not rules[0].regex:
+            return _compile_literal_rule(rules[0])
+        return functools.partial(
+            re.compile(rules[0].pattern).sub, rules[0].replacement
+        )
+
+    # scan the text once for all the rules; at a given position the first
+    # matching rule wins. literal rules are escaped into the alternation and
+    # keep their replacement as it is. the regex rules can't refer to their
+    # own groups by number within the pattern, since the groups get
+    # renumbered here.
+    group_to_rule: T.Dict[int, T.Tuple[T.Optional[T.Pattern[str]], str]] = {}
+    patterns: T.List[str] = []
+    group = 1
+    for rule in rules:
+        if rule.regex:
+            regex = re.compile(rule.pattern)
+            group_to_rule[group] = (regex, rule.replacement)
+            patterns.append(f"({rule.pattern})")
+            group += 1 + regex.groups
+        else:
+            group_to_rule[group] = (None, rule.replacement)
+            patterns.append(f"({re.escape(rule.pattern)})")
+            group += 1
+    combined_regex = re.compile("|".join(patterns))
+
+    def replace(match: T.Match[str]) -> str:
+        regex, replacement = group_to_rule[match.lastindex]
+        if regex is None:
+            return replacement
+        rule_match = regex.match(match.string, match.start())
+        return rule_match.expand(replacement)
+
+    return functools.partial(combined_regex.sub, replace)
+
+
+class RuleSet:
+    # single_scan compiles all the rules into one alternation, so that every
+    # rule sees the original text and more rules don't mean more passes.
+    # otherwise the rules run in order, each on the previous one's output:
+    # literal rules as str.replace, which beats the alternation for the few
+    # builtin rules, and runs of regex rules as one alternation each.
+    def __init__(
+        self, rules: T.Iterable[Rule], single_scan: bool = False
+    ) -> None:
+        self.rules = tuple(rules)
+        self.single_scan = single_scan
+        self._hash = hash((self.rules, single_scan))
+        self._steps: T.List[T.Callable[[str], str]] = []
+        if single_scan:
+            if self.rules:
+                self._steps.append(_compile_combined_rules(list(self.rules)))
+            return
+        for is_regex, group in itertools.groupby(
+            self.rules, key=lambda rule: rule.regex
+        ):
+            if is_regex:
+                self._steps.append(_compile_combined_rules(list(group)))
+            else:
+                self._steps.extend(map(_compile_literal_rule, group))
+
+    @property
+    def step_count(self) -> int:
+        return len(self._steps)
+
+    def apply(self, text: str) -> str:
+        for step in self._steps:
+            text = step(text)
+        return text
+
+    def __add__(self, other: "RuleSet") -> "RuleSet":
+        return RuleSet(
+            self.rules + other.rules, self.single_scan and other.single_scan
+        )
+
+    def __eq__(self, other: T.Any) -> bool:
+        return (
+            isinstance(other, RuleSet)
+            and self.rules == other.rules
+            and self.single_scan == other.single_scan
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self) -> T.Tuple[T.Any, ...]:
+        # compiled steps can't be pickled, so recompile on the other side
+        return RuleSet, (self.rules, self.single_scan)
@@ -1,16 +1,29 @@
+import random
+import typing as T
+
+import ass_tag_parser
 import pytest
-from ass_parser import AssEvent
+from ass_parser import AssEvent, AssStyle
 
 from .process import (
+    LRUCache,
     ProcessingError,
+    cache_fix_texts,
     convert_to_smart_quotes,
+    find_smart_quotes,
     fix_bad_dialogue_dashes,
     fix_dangling_ass_tags,
     fix_disjoint_ass_tags,
     fix_punctuation,
+    fix_text,
+    fix_text_cache_clear,
+    fix_text_cache_info,
     fix_useless_ass_tags,
     fix_whitespace,
+    get_cached_fix_texts,
+    get_style_key,
 )
+from .rules import Rule, RuleSet
 
 
 def test_fix_disjointed_ass_tags() -> None:
@@ -77,6 +90,151 @@ def test_fix_punctuation() -> None:
     )
 
 
+def test_fix_text() -> None:
+    assert fix_text("{\\i1}asd{\\i0}") == "{\\i1}asd"
+    assert (
+        fix_text("asd\\N{\\i1}{\\i0}- asd...")
+        == "asd\\N{\\i1\\i0}\N{EN DASH} asd\N{HORIZONTAL ELLIPSIS}"
+    )
+    assert fix_text("{\\i1}asd\\n{\\i1}- asd") == "{\\i1}asd\\N- asd"
+    assert fix_text("{\\nonsense- asd\\N - asd ") == "{\\Nonsense- asd\\N- asd"
+    assert (
+        fix_text(
+            "{\\i1\\an8}asd",
+            AssStyle(name="Default", italic=True, alignment=8),
+        )
+        == "asd"
+    )
+
+
+FUZZ_CHUNKS = [
+    "asd",
+    " ",
+    "  ",
+    "- ",
+    "...",
+    "\N{HORIZONTAL ELLIPSIS}.",
+    "\\N",
+    "\\n",
+    "\\h",
+    "\n",
+    "{",
+    "}",
+    "}{",
+    "{}",
+    "{comment}",
+    "}}{{comment}",
+    "{\\i1}",
+    "{\\i0}",
+    "{\\b1}",
+    "{\\b900}",
+    "{\\an8}",
+    "{\\a6}",
+    "{\\k0}",
+    "{\\k10}",
+    "{\\fs20.0}",
+    "{\\t(\\i1)}",
+    "{\\p1}m 0 0 l 1 1{\\p0}",
+    "{\\nonsense}",
+]
+FUZZ_STYLES = [
+    None,
+    AssStyle(name="Default"),
+    AssStyle(name="Alt", italic=True, bold=False, alignment=8),
+]
+
+
+def fix_text_reference(text: str, style: T.Optional[AssStyle]) -> str:
+    text = text.replace("\\N", "\n")
+    text = text.replace("\\n", "\n")
+    text = fix_disjoint_ass_tags(text)
+    text = fix_dangling_ass_tags(text)
+    text = fix_useless_ass_tags(text, style)
+    text = fix_bad_dialogue_dashes(text)
+    text = fix_whitespace(text)
+    text = fix_punctuation(text)
+    return text.replace("\n", "\\N")
+
+
+def test_fix_text_user_rules() -> None:
+    rules = RuleSet(
+        [
+            Rule("\\N", " / "),
+            Rule(r"\bgonna\b", "going to", regex=True),
+            Rule(r"(\d+)%", r"\1 percent", regex=True),
+        ]
+    )
+    assert (
+        fix_text("I'm gonna\\Ngo... 100%", rules=rules)
+        == "I'm going to / go\N{HORIZONTAL ELLIPSIS} 100 percent"
+    )
+
+
+def test_fix_text_fuzz() -> None:
+    rng = random.Random(0)
+    fix_text_cache_clear()
+    parse_errors = 0
+
+    for _ in range(2000):
+        text = "".join(
+            rng.choice(FUZZ_CHUNKS) for _ in range(rng.randint(0, 12))
+        )
+        style = rng.choice(FUZZ_STYLES)
+        try:
+            ass_tag_parser.parse_ass(text)
+        except ass_tag_parser.ParseError:
+            parse_errors += 1
+        assert fix_text(text, style) == fix_text_reference(text, style), text
+
+    # make sure the fallbacks for unparseable lines are exercised too
+    assert parse_errors > 100
+
+
+def test_fix_text_cache() -> None:
+    fix_text_cache_clear()
+    style = AssStyle(name="Default", italic=True)
+
+    assert fix_text("{\\i1}asd", style) == "asd"
+    assert fix_text("{\\i1}asd", style) == "asd"
+    assert fix_text("{\\i1}asd") == "{\\i1}asd"
+
+    cache_info = fix_text_cache_info()
+    assert cache_info.hits == 1
+    assert cache_info.misses == 2
+    assert cache_info.currsize == 2
+
+    fix_text_cache_clear()
+    assert fix_text_cache_info().currsize == 0
+
+
+def test_fix_text_cache_bulk() -> None:
+    fix_text_cache_clear()
+    style_key = get_style_key(AssStyle(name="Default", italic=True))
+    items = [("{\\i1}asd", style_key), ("a  b", style_key)]
+    assert get_cached_fix_texts(items) == [None, None]
+
+    # results computed elsewhere, as in the bulk mode workers
+    cache_fix_texts(items, None, ["asd", "a b"])
+    assert get_cached_fix_texts(items) == ["asd", "a b"]
+    assert get_cached_fix_texts(items, RuleSet([])) == [None, None]
+    assert fix_text("a  b", AssStyle(name="Default", italic=True)) == "a b"
+
+    cache_info = fix_text_cache_info()
+    assert (cache_info.hits, cache_info.misses) == (3, 4)
+    fix_text_cache_clear()
+
+
+def test_lru_cache() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.info() == (3, 1, 2, 2)
+
+
 def test_convert_to_smart_quotes() -> None:
     events = [
         AssEvent(text='"Infix". "Prefix…'),
@@ -96,3 +254,27 @@ def test_convert_to_smart_quotes() -> None:
         convert_to_smart_quotes(
             [AssEvent(text='"uneven quotation mark count')], "„", "”"
         )
+
+
+def test_find_smart_quotes() -> None:
+    events = [
+        AssEvent(text='"Infix". "Prefix…'),
+        AssEvent(text="ignore"),
+        AssEvent(text='…suffix"'),
+        AssEvent(text="„Already” smart"),
+    ]
+
+    assert find_smart_quotes(events, "„", "”") == [
+        (0, 0),
+        (0, 6),
+        (0, 9),
+        (2, 7),
+    ]
+    assert events[0].text == '"Infix". "Prefix…'
+
+    with pytest.raises(
+        ProcessingError, match="uneven double quotation mark count"
+    ):
+        find_smart_quotes(
+            [AssEvent(text='"uneven quotation mark count')], "„", "”"
+        )
@@ -0,0 +1,82 @@
+import pickle
+
+from .rules import Rule, RuleSet
+
+
+def test_literal_rules() -> None:
+    rules = RuleSet([Rule("a", "b"), Rule("b", "c")])
+    assert rules.apply("ab") == "cc"
+
+
+def test_regex_rule() -> None:
+    rules = RuleSet([Rule(r"(\w+)@", r"<\1>", regex=True)])
+    assert rules.apply("x@ yy@") == "<x> <yy>"
+
+
+def test_combined_regex_rules() -> None:
+    rules = RuleSet(
+        [
+            Rule(r"(a)(b)", r"\2\1", regex=True),
+            Rule(r"b+", "B", regex=True),
+            Rule(r"(c)", r"\1\1", regex=True),
+        ]
+    )
+    # a single scan: rules don't see each other's output
+    assert rules.apply("abbbc") == "baBcc"
+    assert rules.apply("cab") == "ccba"
+
+
+def test_combined_regex_rules_priority() -> None:
+    rules = RuleSet(
+        [Rule("ab", "1", regex=True), Rule("abc", "2", regex=True)]
+    )
+    assert rules.apply("abc") == "1c"
+
+
+def test_mixed_rules_keep_order() -> None:
+    rules = RuleSet(
+        [
+            Rule("...", "\N{HORIZONTAL ELLIPSIS}"),
+            Rule(
+                "\N{HORIZONTAL ELLIPSIS}\\.+",
+                "\N{HORIZONTAL ELLIPSIS}",
+                regex=True,
+            ),
+        ]
+    )
+    assert rules.apply("asd....") == "asd\N{HORIZONTAL ELLIPSIS}"
+
+
+def test_single_scan_rules() -> None:
+    rules = RuleSet(
+        [
+            Rule("a.", r"\1"),
+            Rule(r"(b)+", r"<\1>", regex=True),
+            Rule("c", "b"),
+            Rule(r"\d", "#", regex=True),
+        ],
+        single_scan=True,
+    )
+    assert rules.step_count == 1
+    # literals aren't patterns, nor are their replacements templates; no
+    # rule sees another's output
+    assert rules.apply("a.ab bbc1") == r"\1a<b> <b>b#"
+
+
+def test_rule_set_add() -> None:
+    rules = RuleSet([Rule("a", "b")]) + RuleSet([Rule("b", "c")])
+    assert rules.apply("a") == "c"
+
+
+def test_rule_set_pickle() -> None:
+    rules = RuleSet([Rule("a", "b"), Rule("x+", "y", regex=True)])
+    unpickled = pickle.loads(pickle.dumps(rules))
+    assert unpickled == rules
+    assert hash(unpickled) == hash(rules)
+    assert unpickled.apply("axx") == "by"
+
+    rules = RuleSet([Rule("a", "b"), Rule("b", "c")], single_scan=True)
+    unpickled = pickle.loads(pickle.dumps(rules))
+    assert unpickled == rules
+    assert unpickled != RuleSet(rules.rules)
+    assert unpickled.apply("ab") == "bc"
@@ -1,17 +1,25 @@
-import re
+import argparse
+import asyncio
+import typing as T
+from pathlib import Path
 
 from ass_parser import AssEvent
 from PyQt5 import QtWidgets
 
+from bubblesub.api import Api
 from bubblesub.api.cmd import BaseCommand, CommandUnavailable
 from bubblesub.cfg.menu import MenuCommand
 from bubblesub.ui.util import load_dialog
 
+from .process import Cue, clean_closed_caption, coalesce_cues
+
 try:
     import pysubs2
 except ImportError:
     raise CommandUnavailable("pysubs2 is not installed") from None
 
+PROGRESS_INTERVAL = 5000
+
 
 class LoadClosedCaptionsCommand(BaseCommand):
     names = ["load-cc"]
@@ -27,17 +35,51 @@ class LoadClosedCaptionsCommand(BaseCommand):
         if not path:
             return
 
-        source = pysubs2.load(str(path))
+        # don't clog the UI thread
+        self.api.log.info(f"loading closed captions from {path}...")
+        events = await asyncio.get_event_loop().run_in_executor(
+            None, self.load_events, path, self.api.subs.default_style_name
+        )
+
         with self.api.undo.capture():
-            for line in source:
-                self.api.subs.events.append(
-                    AssEvent(
-                        start=line.start,
-                        end=line.end,
-                        note=line.text,
-                        style_name=self.api.subs.default_style_name,
-                    )
+            self.api.subs.events.extend(events)
+        self.api.log.info(f"loaded {len(events)} closed captions")
+
+    def load_events(self, path: Path, style_name: str) -> T.List[AssEvent]:
+        source = pysubs2.load(str(path))
+        cues = [
+            Cue(start=line.start, end=line.end, text=line.text)
+            for line in source
+        ]
+        if self.args.coalesce:
+            self.api.log.info(f"coalescing {len(cues)} closed captions...")
+            cues = coalesce_cues(cues)
+
+        events: T.List[AssEvent] = []
+        for i, cue in enumerate(cues, 1):
+            events.append(
+                AssEvent(
+                    start=cue.start,
+                    end=cue.end,
+                    note=cue.text,
+                    style_name=style_name,
                 )
+            )
+            if i % PROGRESS_INTERVAL == 0:
+                self.api.log.info(f"read {i}/{len(cues)} closed captions...")
+        return events
+
+    @staticmethod
+    def decorate_parser(api: Api, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "-c",
+            "--coalesce",
+            help=(
+                "merge overlapping roll-up captions that repeat or extend "
+                "the previous caption into a single event"
+            ),
+            action="store_true",
+        )
 
 
 class CleanClosedCaptionsCommand(BaseCommand):
@@ -47,22 +89,16 @@ class CleanClosedCaptionsCommand(BaseCommand):
     )
 
     async def run(self):
+        events = self.api.subs.selected_events
+        notes = [event.note for event in events]
+        new_notes = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: [clean_closed_caption(note) for note in notes]
+        )
         with self.api.undo.capture():
-            for line in self.api.subs.selected_events:
-                note = line.note
-                note = re.sub(r"\\N", "\n", note)
-                note = re.sub(r"\(\(\)\)", "", note)  # retrospection
-                note = re.sub(r"\([^\(\)]*\)", "", note)  # actors
-                note = re.sub(r"\[[^\[\]]*\]", "", note)  # actors
-                note = re.sub("[➡→]", "", note)  # line continuation
-                note = re.sub("≪", "", note)  # distant dialogues
-                note = re.sub("[＜＞《》]", "", note)
-                note = re.sub("｡", "。", note)  # half-width period
-                note = re.sub("([…！？])。", r"\1", note)  # unneeded periods
-                note = note.rstrip("・")
-                note = re.sub(" ", "", note)  # Japanese doesn't need spaces
-                note = note.strip()
-                line.note = note
+            for event, note, new_note in zip(events, notes, new_notes):
+                # don't clobber notes edited in the meantime
+                if event.note == note and new_note != note:
+                    event.note = new_note
 
 
 COMMANDS = [LoadClosedCaptionsCommand, CleanClosedCaptionsCommand]
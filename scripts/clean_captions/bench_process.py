@@ -0,0 +1,68 @@
+# Benchmarks for the closed caption cleanup against the plain chain of
+# re.sub calls it replaced. Kept out of the regular test run:
+#
+#   pytest clean_captions/bench_process.py
+import functools
+import random
+import typing as T
+
+import pytest
+
+from .process import clean_closed_caption
+from .test_process import clean_closed_caption_reference
+
+pytest.importorskip("pytest_benchmark")
+
+CORPUS_SIZES = [1_000, 20_000]
+CHARACTERS = (
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほ"
+    "まみむめもやゆよらりるれろわをんアイウエオ日本語漢字"
+)
+DECORATIONS = [
+    "（男）",
+    "(男)",
+    "[女]",
+    "(())",
+    "→",
+    "➡",
+    "≪",
+    "＜",
+    "＞",
+    "《",
+    "》",
+    "｡",
+    "。",
+    "…。",
+    "！",
+    "？。",
+    "・",
+    " ",
+    "\\N",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def get_corpus(size: int) -> T.Tuple[str, ...]:
+    rng = random.Random(size)
+    corpus: T.List[str] = []
+    for _ in range(size):
+        note = "".join(rng.choices(CHARACTERS, k=rng.randint(5, 30)))
+        for _ in range(rng.randint(0, 3)):
+            pos = rng.randint(0, len(note))
+            note = note[:pos] + rng.choice(DECORATIONS) + note[pos:]
+        corpus.append(note)
+    return tuple(corpus)
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+@pytest.mark.parametrize(
+    "cleaner", [clean_closed_caption, clean_closed_caption_reference]
+)
+def test_clean_closed_caption(
+    benchmark: T.Any, cleaner: T.Callable[[str], str], size: int
+) -> None:
+    corpus = get_corpus(size)
+    benchmark.group = f"{size} captions"
+    benchmark.pedantic(
+        lambda: [cleaner(note) for note in corpus], rounds=5, warmup_rounds=1
+    )
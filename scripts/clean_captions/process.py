@@ -0,0 +1,56 @@
+import re
+import typing as T
+
+RETROSPECTION_REGEX = re.compile(r"\(\(\)\)")  # retrospection
+PARENTHESIZED_ACTORS_REGEX = re.compile(r"\([^\(\)]*\)")  # actors
+BRACKETED_ACTORS_REGEX = re.compile(r"\[[^\[\]]*\]")  # actors
+# line continuation, distant dialogues and brackets
+DELETED_CHARACTERS_REGEX = re.compile("[➡→≪＜＞《》]")
+UNNEEDED_PERIODS_REGEX = re.compile("([…！？])。")
+
+
+def clean_closed_caption(note: str) -> str:
+    # the rules depend on each other's output, so they keep their order;
+    # the ones that need a particular character are skipped when it's absent
+    note = note.replace("\\N", "\n")
+    if "(" in note:
+        note = RETROSPECTION_REGEX.sub("", note)
+        note = PARENTHESIZED_ACTORS_REGEX.sub("", note)
+    if "[" in note:
+        note = BRACKETED_ACTORS_REGEX.sub("", note)
+    note = DELETED_CHARACTERS_REGEX.sub("", note)
+    note = note.replace("｡", "。")  # half-width period
+    if "。" in note:
+        note = UNNEEDED_PERIODS_REGEX.sub(r"\1", note)
+    note = note.rstrip("・")
+    note = note.replace(" ", "")  # Japanese doesn't need spaces
+    return note.strip()
+
+
+class Cue(T.NamedTuple):
+    start: int
+    end: int
+    text: str
+
+
+def coalesce_cues(cues: T.Iterable[Cue]) -> T.List[Cue]:
+    # roll-up captions repeat the same text over a run of overlapping cues,
+    # each one possibly extending the previous one. with the cues sorted by
+    # their start time only the last merged cue can absorb the next one, so
+    # a single pass is enough (sorting is linear on already sorted input).
+    result: T.List[Cue] = []
+    for cue in sorted(cues, key=lambda cue: (cue.start, cue.end)):
+        if result:
+            last = result[-1]
+            if cue.start <= last.end and (
+                cue.text == last.text
+                or (last.text and cue.text.startswith(last.text))
+            ):
+                result[-1] = Cue(
+                    start=last.start,
+                    end=max(last.end, cue.end),
+                    text=cue.text,
+                )
+                continue
+        result.append(cue)
+    return result
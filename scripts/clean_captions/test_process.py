@@ -0,0 +1,84 @@
+import random
+import re
+
+from .process import Cue, clean_closed_caption, coalesce_cues
+
+FUZZ_CHUNKS = list("あいう漢字 ・…！？。｡➡→≪＜＞《》()[]") + [
+    "\\N",
+    "\\n",
+    "((",
+    "))",
+    "(())",
+    "（男）",
+]
+
+
+def clean_closed_caption_reference(note: str) -> str:
+    note = re.sub(r"\\N", "\n", note)
+    note = re.sub(r"\(\(\)\)", "", note)
+    note = re.sub(r"\([^\(\)]*\)", "", note)
+    note = re.sub(r"\[[^\[\]]*\]", "", note)
+    note = re.sub("[➡→]", "", note)
+    note = re.sub("≪", "", note)
+    note = re.sub("[＜＞《》]", "", note)
+    note = re.sub("｡", "。", note)
+    note = re.sub("([…！？])。", r"\1", note)
+    note = note.rstrip("・")
+    note = re.sub(" ", "", note)
+    note = note.strip()
+    return note
+
+
+def test_clean_closed_caption() -> None:
+    assert clean_closed_caption("(男)あ\\Nい") == "あ\nい"
+    assert clean_closed_caption("[男]あ→") == "あ"
+    assert clean_closed_caption("(a(())b)あ") == "あ"
+    assert clean_closed_caption("≪《あ》｡") == "あ。"
+    assert clean_closed_caption("あ！｡") == "あ！"
+    assert clean_closed_caption("あ…→。") == "あ…"
+    assert clean_closed_caption("あ！ 。") == "あ！。"
+    assert clean_closed_caption(" あ い・・") == "あい"
+    assert clean_closed_caption("あ・ ") == "あ・"
+
+
+def test_clean_closed_caption_fuzz() -> None:
+    rng = random.Random(0)
+    for _ in range(5000):
+        note = "".join(
+            rng.choice(FUZZ_CHUNKS) for _ in range(rng.randint(0, 15))
+        )
+        assert clean_closed_caption(note) == clean_closed_caption_reference(
+            note
+        ), note
+
+
+def test_coalesce_cues() -> None:
+    assert coalesce_cues(
+        [
+            Cue(0, 100, "a"),
+            Cue(50, 150, "a"),
+            Cue(150, 200, "a\\Nb"),
+            Cue(180, 250, "c"),
+            Cue(300, 400, "c"),
+        ]
+    ) == [Cue(0, 200, "a\\Nb"), Cue(180, 250, "c"), Cue(300, 400, "c")]
+
+
+def test_coalesce_cues_unsorted() -> None:
+    assert coalesce_cues(
+        [Cue(100, 300, "ab"), Cue(0, 100, "a"), Cue(50, 120, "a")]
+    ) == [Cue(0, 300, "ab")]
+
+
+def test_coalesce_cues_doesnt_shorten() -> None:
+    assert coalesce_cues([Cue(0, 100, "ab"), Cue(50, 150, "a")]) == [
+        Cue(0, 100, "ab"),
+        Cue(50, 150, "a"),
+    ]
+
+
+def test_coalesce_cues_empty_text() -> None:
+    assert coalesce_cues([Cue(0, 100, ""), Cue(50, 150, "a")]) == [
+        Cue(0, 100, ""),
+        Cue(50, 150, "a"),
+    ]
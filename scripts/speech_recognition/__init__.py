@@ -1,9 +1,13 @@
+from __future__ import annotations
+
 import argparse
 import asyncio
 import concurrent.futures
-import io
+import hashlib
+import os
 import time
 import typing as T
+from pathlib import Path
 
 from ass_parser import AssEvent
 
@@ -13,25 +17,91 @@ from bubblesub.cfg.menu import MenuCommand, SubMenu
 from bubblesub.cmd.common import SubtitlesSelection
 
 try:
+    import numpy  # pylint: disable=unused-import
     import speech_recognition as sr  # pylint: disable=import-self
-except ImportError:
-    raise CommandUnavailable("speech_recognition is not installed") from None
+except ImportError as ex:
+    raise CommandUnavailable(f"{ex.name} is not installed") from None
+
+from .backends import BACKENDS, Backend, create_backend
+from .cache import MISSING, RecognitionCache, get_cache_key
+from .journal import JobJournal, Status, get_job_key
+from .metrics import LatencyHistogram
+from .pcm import (
+    PcmBuffer,
+    PcmBufferIndex,
+    get_covering_ranges,
+    normalize_int16,
+    preprocess,
+)
+from .rate_limit import TokenBucket
+from .segments import (
+    Result,
+    dump_result,
+    group_ranges,
+    load_result,
+    split_result,
+)
 
 LEAD_IN = 100
 LEAD_OUT = 100
+RETRY_DELAY = 0.5
+CACHE_SIZE = 100_000
+# the recognizers don't need anything above that, so don't upload it
+SAMPLE_RATE = 16000
+
 
+class Segment(T.NamedTuple):
+    subtitles: T.List[AssEvent]
+    start: int
+    audio_data: sr.AudioData
+    cache_key: str
+
+
+def get_audio_range(subtitles: T.List[AssEvent]) -> T.Tuple[int, int]:
+    return (
+        min(subtitle.start for subtitle in subtitles) - LEAD_IN,
+        max(subtitle.end for subtitle in subtitles) + LEAD_OUT,
+    )
 
-def divide_into_groups(
-    source: T.Sequence[T.Any], size: int
-) -> T.Iterable[T.Sequence[T.Any]]:
-    size = max(1, size)
-    return (source[i : i + size] for i in range(0, len(source), size))
+
+class RecognitionContext(T.NamedTuple):
+    audio: PcmBufferIndex
+    backend: Backend
+    cache: RecognitionCache
+    journal: T.Optional[JobJournal]
+    executor: concurrent.futures.Executor
+    rate_limiter: T.Optional[TokenBucket]
+    latencies: LatencyHistogram
+
+
+def append_note(subtitle: AssEvent, note: str) -> None:
+    if subtitle.note:
+        subtitle.note += r"\N" + note
+    else:
+        subtitle.note = note
+
+
+def get_audio_data(
+    audio: PcmBufferIndex, start: int, end: int, normalize: bool
+) -> sr.AudioData:
+    buffer = audio.find(start)
+    samples = buffer.get_samples(start, end)
+    if normalize:
+        # after slicing, so that a loud line doesn't keep a quiet one
+        # sharing its decoded range quiet
+        samples = normalize_int16(samples)
+    # a byte view of the slice keeps it zero-copy all the way into AudioData
+    return sr.AudioData(
+        memoryview(samples).cast("B"),
+        buffer.sample_rate,
+        buffer.sample_width,
+    )
 
 
 class SpeechRecognitionCommand(BaseCommand):
     names = ["sr", "google-speech-recognition"]
     help_text = (
-        "Puts results of Google speech recognition "
+        "Puts results of speech recognition "
         "for selected subtitles into their notes."
     )
 
@@ -44,95 +114,431 @@ class SpeechRecognitionCommand(BaseCommand):
         )
 
     async def run(self) -> None:
-        await asyncio.get_event_loop().run_in_executor(
-            None,
-            self.run_in_background,
-            await self.args.target.get_subtitles(),
-        )
+        subtitles = await self.args.target.get_subtitles()
+
+        # the local backends take a while to load their models
+        try:
+            backend = await asyncio.get_event_loop().run_in_executor(
+                None,
+                create_backend,
+                self.args.backend,
+                self.args.code,
+                self.args.model,
+                bool(self.args.merge_gap),
+            )
+        except ImportError as ex:
+            self.api.log.error(f"{ex.name} is not installed")
+            return
 
-    def run_in_background(self, subtitles: T.List[AssEvent]) -> None:
         if self.args.audio:
+            await self.run_on_audio_selection(subtitles, backend)
+        else:
+            await self.run_on_subtitles(subtitles, backend)
+
+    async def run_on_audio_selection(
+        self, subtitles: T.List[AssEvent], backend: Backend
+    ) -> None:
+        start = self.api.audio.view.selection_start - LEAD_IN
+        end = self.api.audio.view.selection_end + LEAD_OUT
+        try:
+            result = await asyncio.get_event_loop().run_in_executor(
+                None, self.recognize_audio_range, backend, start, end
+            )
+        except sr.RequestError as ex:
+            self.api.log.error(f"error ({ex})")
+            return
+
+        if result is None:
+            self.api.log.warn("not recognized")
+        else:
+            self.api.log.info("OK")
+            with self.api.undo.capture():
+                for subtitle in subtitles:
+                    append_note(subtitle, result.text)
+
+    async def run_on_subtitles(
+        self,
+        subtitles: T.List[AssEvent],
+        backend: Backend,
+        latencies: T.Optional[LatencyHistogram] = None,
+    ) -> None:
+        journal = self.open_journal()
+        if self.args.resume:
+            if not journal:
+                self.api.log.error("can't resume: the subtitles aren't saved")
+                return
+            subtitles = self.skip_finished_subtitles(
+                subtitles, journal, backend
+            )
+            if not subtitles:
+                journal.close()
+                return
+
+        groups = self.group_subtitles(subtitles)
+
+        # decode the audio once for all the lines rather than once per line
+        self.api.log.info("decoding audio...")
+        audio = await asyncio.get_event_loop().run_in_executor(
+            None, self.decode_audio, list(map(get_audio_range, groups))
+        )
+
+        queue: "asyncio.Queue[T.List[AssEvent]]" = asyncio.Queue()
+        for group in groups:
+            queue.put_nowait(group)
+        if journal:
+            for subtitle in subtitles:
+                journal.set(
+                    self.get_subtitle_job_key(subtitle, backend),
+                    Status.PENDING,
+                )
+
+        cache = RecognitionCache(
+            self.get_cache_dir() / "speech_recognition.sqlite",
+            max_size=CACHE_SIZE,
+        )
+        if self.args.clear_cache:
+            cache.clear()
+
+        max_workers = self.args.max_workers
+        if backend.max_concurrency:
+            max_workers = min(max_workers, backend.max_concurrency)
+
+        # one pool for the whole run: the workers pick up the next lines as
+        # soon as they're done with the previous ones, so a slow request
+        # doesn't hold back the others
+        context = RecognitionContext(
+            audio=audio,
+            backend=backend,
+            cache=cache,
+            journal=journal,
+            executor=concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers
+            ),
+            rate_limiter=(
+                TokenBucket(rate=self.args.rate, capacity=max_workers)
+                if self.args.rate
+                else None
+            ),
+            latencies=(
+                latencies if latencies is not None else LatencyHistogram()
+            ),
+        )
+        workers = [
+            asyncio.ensure_future(self.recognize_queue(queue, context))
+            for _ in range(min(max_workers, len(groups)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            context.executor.shutdown(wait=False, cancel_futures=True)
+            cache.evict()
+            cache.close()
+            self.api.log.info(
+                f"cache: {cache.hits} hits, {cache.misses} misses "
+                f"({cache.hit_rate:.0%} hit rate)"
+            )
+            for line in context.latencies.format():
+                self.api.log.info(line)
+            if journal:
+                self.log_journal_summary(subtitles, journal, backend)
+                journal.close()
+
+    def open_journal(self) -> T.Optional[JobJournal]:
+        if not self.api.subs.path:
+            return None
+        name = hashlib.sha1(
+            str(self.api.subs.path.resolve()).encode()
+        ).hexdigest()
+        return JobJournal(
+            self.get_cache_dir() / "speech_recognition" / f"{name}.jsonl"
+        )
+
+    def skip_finished_subtitles(
+        self,
+        subtitles: T.List[AssEvent],
+        journal: JobJournal,
+        backend: Backend,
+    ) -> T.List[AssEvent]:
+        remaining: T.List[AssEvent] = []
+        restored: T.List[T.Tuple[AssEvent, str]] = []
+        for subtitle in subtitles:
+            entry = journal.get(self.get_subtitle_job_key(subtitle, backend))
+            if not entry or entry.status != Status.DONE:
+                remaining.append(subtitle)
+            elif entry.note and entry.note not in subtitle.note.split(r"\N"):
+                # the result was lost along with unsaved changes
+                restored.append((subtitle, entry.note))
+
+        if restored:
+            with self.api.undo.capture():
+                for subtitle, note in restored:
+                    append_note(subtitle, note)
+        self.api.log.info(
+            f"resuming: {len(subtitles) - len(remaining)} lines already done "
+            f"({len(restored)} restored from the journal), "
+            f"{len(remaining)} left"
+        )
+        return remaining
+
+    def log_journal_summary(
+        self,
+        subtitles: T.List[AssEvent],
+        journal: JobJournal,
+        backend: Backend,
+    ) -> None:
+        keys = [
+            self.get_subtitle_job_key(subtitle, backend)
+            for subtitle in subtitles
+        ]
+        counts = {
+            status: journal.count(keys, status)
+            for status in [Status.FAILED, Status.TIMEOUT, Status.PENDING]
+        }
+        self.api.log.info(
+            f"{journal.count(keys, Status.DONE)} lines done, "
+            + ", ".join(
+                f"{count} {status.value}" for status, count in counts.items()
+            )
+        )
+        if any(counts.values()):
+            self.api.log.info("run again with --resume to retry the rest")
+
+    def group_subtitles(
+        self, subtitles: T.List[AssEvent]
+    ) -> T.List[T.List[AssEvent]]:
+        if not self.args.merge_gap:
+            return [[subtitle] for subtitle in subtitles]
+        groups = [
+            [subtitles[idx] for idx in group]
+            for group in group_ranges(
+                [(subtitle.start, subtitle.end) for subtitle in subtitles],
+                max_gap=self.args.merge_gap,
+                max_duration=self.args.merge_max_duration,
+            )
+        ]
+        self.api.log.info(
+            f"merged {len(subtitles)} lines into {len(groups)} requests"
+        )
+        return groups
+
+    async def recognize_queue(
+        self,
+        queue: "asyncio.Queue[T.List[AssEvent]]",
+        context: RecognitionContext,
+    ) -> None:
+        while not queue.empty():
+            batch: T.List[Segment] = []
+            while (
+                len(batch) < context.backend.batch_size and not queue.empty()
+            ):
+                group = queue.get_nowait()
+                start, end = get_audio_range(group)
+                audio_data = get_audio_data(
+                    context.audio, start, end, self.args.normalize
+                )
+                segment = Segment(
+                    subtitles=group,
+                    start=max(0, start),
+                    audio_data=audio_data,
+                    cache_key=get_cache_key(
+                        audio_data.frame_data,
+                        audio_data.sample_rate,
+                        audio_data.sample_width,
+                        self.args.code,
+                        context.backend.name,
+                    ),
+                )
+                cached_result = context.cache.get(segment.cache_key)
+                if cached_result is MISSING:
+                    batch.append(segment)
+                else:
+                    self.apply_result(
+                        segment, load_result(cached_result), context
+                    )
+            if not batch:
+                continue
+
             try:
-                note = self.recognize_audio_selection()
-            except sr.UnknownValueError:
-                self.api.log.warn("not recognized")
+                results = await self.recognize_batch_with_retries(
+                    batch, context
+                )
+            except (asyncio.TimeoutError, TimeoutError):
+                self.mark_failed(batch, Status.TIMEOUT, "timeout", context)
+                continue
             except sr.RequestError as ex:
-                self.api.log.error(f"error ({ex})")
-            else:
-                self.api.log.info("OK")
-                with self.api.undo.capture():
-                    for subtitle in subtitles:
-                        if subtitle.note:
-                            subtitle.note += r"\N" + note
-                        else:
-                            subtitle.note = note
-            return
+                self.mark_failed(
+                    batch, Status.FAILED, f"error ({ex})", context
+                )
+                continue
+
+            for segment, result in zip(batch, results):
+                context.cache.put(segment.cache_key, dump_result(result))
+                self.apply_result(segment, result, context)
 
-        for i, subtitle_group in enumerate(
-            divide_into_groups(subtitles, self.args.max_workers)
-        ):
-            if i:
-                time.sleep(self.args.sleep_time)
-
-            with concurrent.futures.ThreadPoolExecutor(
-                max_workers=self.args.max_workers
-            ) as executor:
-                future_to_sub = {
-                    executor.submit(
-                        self.recognize_subtitle, subtitle
-                    ): subtitle
-                    for subtitle in subtitle_group
-                }
-
-                completed, non_completed = concurrent.futures.wait(
-                    future_to_sub, timeout=self.args.timeout
+    async def recognize_batch_with_retries(
+        self, batch: T.List[Segment], context: RecognitionContext
+    ) -> T.List[T.Optional[Result]]:
+        attempt = 0
+        while True:
+            if context.rate_limiter:
+                await context.rate_limiter.acquire()
+            for segment in batch:
+                for subtitle in segment.subtitles:
+                    self.api.log.info(f"line #{subtitle.number} - analyzing")
+            try:
+                return await self.recognize_batch(batch, context)
+            except sr.RequestError as ex:
+                if attempt >= self.args.retries:
+                    raise
+                delay = RETRY_DELAY * 2**attempt
+                self.api.log.warn(
+                    f"line #{batch[0].subtitles[0].number}: error ({ex}), "
+                    f"retrying in {delay:.1f} s"
                 )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def recognize_batch(
+        self, batch: T.List[Segment], context: RecognitionContext
+    ) -> T.List[T.Optional[Result]]:
+        loop = asyncio.get_event_loop()
+        timeout = self.args.timeout or context.backend.default_timeout
+        started: "asyncio.Future[float]" = loop.create_future()
+
+        def mark_started() -> None:
+            if not started.done():
+                started.set_result(time.monotonic())
+
+        def recognize() -> T.List[T.Optional[Result]]:
+            loop.call_soon_threadsafe(mark_started)
+            return context.backend.recognize(
+                [segment.audio_data for segment in batch], timeout
+            )
+
+        job = loop.run_in_executor(context.executor, recognize)
+        # the timeout only counts from when a pool thread picks the job up,
+        # so a job queued behind a slow one doesn't time out as well
+        await asyncio.wait([job, started], return_when=asyncio.FIRST_COMPLETED)
+        start_time = started.result() if started.done() else time.monotonic()
+        try:
+            return await asyncio.wait_for(
+                job,
+                timeout=(
+                    None
+                    if timeout is None
+                    else max(0, timeout - (time.monotonic() - start_time))
+                ),
+            )
+        finally:
+            context.latencies.record(time.monotonic() - start_time)
 
-                with self.api.undo.capture():
-                    for future, subtitle in future_to_sub.items():
-                        if future not in completed:
-                            continue
-                        try:
-                            note = future.result()
-                        except sr.UnknownValueError:
-                            self.api.log.warn(
-                                f"line #{subtitle.number}: not recognized"
-                            )
-                        except sr.RequestError as ex:
-                            self.api.log.error(
-                                f"line #{subtitle.number}: error ({ex})"
-                            )
-                        else:
-                            self.api.log.info(f"line #{subtitle.number}: OK")
-                            if subtitle.note:
-                                subtitle.note += r"\N" + note
-                            else:
-                                subtitle.note = note
-
-                for future, subtitle in future_to_sub.items():
-                    if future in non_completed:
-                        self.api.log.info(f"line #{subtitle.number}: timeout")
-
-    def recognize_subtitle(self, subtitle: AssEvent) -> str:
-        self.api.log.info(f"line #{subtitle.number} - analyzing")
-        return self.recognize_audio(
-            subtitle.start - LEAD_IN, subtitle.end + LEAD_OUT
-        )
-
-    def recognize_audio_selection(self) -> str:
-        return self.recognize_audio(
-            self.api.audio.view.selection_start - LEAD_IN,
-            self.api.audio.view.selection_end + LEAD_OUT,
-        )
-
-    def recognize_audio(self, start: int, end: int) -> str:
-        recognizer = sr.Recognizer()
-        with io.BytesIO() as handle:
-            self.api.audio.current_stream.save_wav(handle, start, end)
-            handle.seek(0, io.SEEK_SET)
-            with sr.AudioFile(handle) as source:
-                audio = recognizer.record(source)
-            return recognizer.recognize_google(audio, language=self.args.code)
+    def mark_failed(
+        self,
+        batch: T.List[Segment],
+        status: Status,
+        message: str,
+        context: RecognitionContext,
+    ) -> None:
+        for segment in batch:
+            for subtitle in segment.subtitles:
+                self.api.log.error(f"line #{subtitle.number}: {message}")
+                if context.journal:
+                    context.journal.set(
+                        self.get_subtitle_job_key(subtitle, context.backend),
+                        status,
+                    )
+
+    def apply_result(
+        self,
+        segment: Segment,
+        result: T.Optional[Result],
+        context: RecognitionContext,
+    ) -> None:
+        notes = split_result(
+            result,
+            [
+                (subtitle.start - segment.start, subtitle.end - segment.start)
+                for subtitle in segment.subtitles
+            ],
+        )
+        for subtitle, note in zip(segment.subtitles, notes):
+            if note is None:
+                self.api.log.warn(f"line #{subtitle.number}: not recognized")
+            else:
+                self.api.log.info(f"line #{subtitle.number}: OK")
+        if any(note is not None for note in notes):
+            with self.api.undo.capture():
+                for subtitle, note in zip(segment.subtitles, notes):
+                    if note is not None:
+                        append_note(subtitle, note)
+        if context.journal:
+            for subtitle, note in zip(segment.subtitles, notes):
+                context.journal.set(
+                    self.get_subtitle_job_key(subtitle, context.backend),
+                    Status.DONE,
+                    note,
+                )
+
+    def get_subtitle_job_key(
+        self, subtitle: AssEvent, backend: Backend
+    ) -> str:
+        return get_job_key(
+            self.args.code,
+            backend.name,
+            subtitle.index,
+            subtitle.start,
+            subtitle.end,
+        )
+
+    def recognize_audio_range(
+        self, backend: Backend, start: int, end: int
+    ) -> T.Optional[Result]:
+        audio = self.decode_audio([(start, end)])
+        return backend.recognize(
+            [get_audio_data(audio, start, end, self.args.normalize)],
+            self.args.timeout or backend.default_timeout,
+        )[0]
+
+    def get_cache_dir(self) -> Path:
+        options = self.api.cfg.opt.get("plugins", {})
+        path = options.get("sr_cache_dir")
+        if path:
+            return Path(path).expanduser()
+        # older configs pointed at the database file itself
+        path = options.get("sr_cache_path")
+        if path:
+            return Path(path).expanduser().parent
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache_dir) / "bubblesub"
+
+    def decode_audio(
+        self, ranges: T.Iterable[T.Tuple[int, int]]
+    ) -> PcmBufferIndex:
+        stream = self.api.audio.current_stream
+        buffers: T.List[PcmBuffer] = []
+        for start, end in get_covering_ranges(ranges):
+            start_frame = max(0, start * stream.sample_rate // 1000)
+            end_frame = min(
+                stream.sample_count, end * stream.sample_rate // 1000
+            )
+            samples = stream.get_samples(
+                start_frame, max(0, end_frame - start_frame)
+            )
+            buffers.append(
+                PcmBuffer(
+                    preprocess(
+                        samples,
+                        channel_count=stream.channel_count,
+                        sample_rate=stream.sample_rate,
+                        target_rate=SAMPLE_RATE,
+                    ),
+                    sample_rate=min(stream.sample_rate, SAMPLE_RATE),
+                    start=start_frame * 1000 // stream.sample_rate,
+                )
+            )
+        return PcmBufferIndex(buffers)
 
     @staticmethod
     def decorate_parser(api: Api, parser: argparse.ArgumentParser) -> None:
@@ -150,20 +556,75 @@ class SpeechRecognitionCommand(BaseCommand):
             type=int,
             default=5,
         )
+        parser.add_argument(
+            "-b",
+            "--backend",
+            help="speech recognition engine",
+            choices=BACKENDS,
+            default="google",
+        )
+        parser.add_argument(
+            "-M",
+            "--model",
+            help="model to use with the local engines (default: small)",
+        )
         parser.add_argument(
             "-T",
             "--timeout",
-            help="max request timeout",
+            help="max request timeout (default: 8 s for google, none for "
+            "the local engines)",
             type=int,
-            default=8,
         )
         parser.add_argument(
-            "-s",
-            "--sleep-time",
-            help="time to sleep after each chunk",
+            "-r",
+            "--rate",
+            help="max number of requests per second (default: unlimited)",
+            type=float,
+        )
+        parser.add_argument(
+            "-R",
+            "--retries",
+            help="number of retries after a request error",
+            type=int,
+            default=3,
+        )
+        parser.add_argument(
+            "-g",
+            "--merge-gap",
+            help=(
+                "recognize lines closer to each other than this many "
+                "milliseconds in a single request (default: don't merge)"
+            ),
             type=int,
             default=0,
         )
+        parser.add_argument(
+            "-G",
+            "--merge-max-duration",
+            help="max duration of merged lines in milliseconds",
+            type=int,
+            default=10000,
+        )
+        parser.add_argument(
+            "-n",
+            "--normalize",
+            help="normalize the peak volume of the audio before recognition",
+            action="store_true",
+        )
+        parser.add_argument(
+            "-nc",
+            action="store_true",
+            dest="clear_cache",
+            help="clear cache of already recognized lines",
+        )
+        parser.add_argument(
+            "--resume",
+            help=(
+                "process only the lines that didn't finish in the previous "
+                "runs on this file"
+            ),
+            action="store_true",
+        )
         parser.add_argument(
             "-a",
             "--audio",
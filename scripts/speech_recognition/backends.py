@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import abc
+import functools
+import typing as T
+
+import numpy as np
+import speech_recognition as sr  # pylint: disable=import-self
+
+from .segments import Result, Word
+
+
+class Backend(abc.ABC):
+    name: str
+    # number of segments recognized by a single call to recognize()
+    batch_size = 1
+    # number of calls to recognize() that can run at the same time
+    max_concurrency: T.Optional[int] = None
+    default_timeout: T.Optional[float] = None
+
+    @abc.abstractmethod
+    def recognize(
+        self, segments: T.List[sr.AudioData], timeout: T.Optional[float]
+    ) -> T.List[T.Optional[Result]]:
+        # returns None for segments that couldn't be recognized; backends
+        # that can't be interrupted ignore the timeout
+        ...
+
+
+class GoogleBackend(Backend):
+    name = "google"
+    default_timeout = 8
+
+    def __init__(self, language: str) -> None:
+        self.language = language
+
+    def recognize(
+        self, segments: T.List[sr.AudioData], timeout: T.Optional[float]
+    ) -> T.List[T.Optional[Result]]:
+        return [
+            self.recognize_segment(segment, timeout) for segment in segments
+        ]
+
+    def recognize_segment(
+        self, segment: sr.AudioData, timeout: T.Optional[float]
+    ) -> T.Optional[Result]:
+        recognizer = sr.Recognizer()
+        # end the request itself rather than just stop waiting for it, so
+        # it doesn't hold on to a worker thread
+        recognizer.operation_timeout = timeout
+        try:
+            return Result(
+                recognizer.recognize_google(segment, language=self.language)
+            )
+        except sr.UnknownValueError:
+            return None
+
+
+@functools.lru_cache(maxsize=None)
+def load_whisper_model(model_name: str) -> T.Any:
+    # loaded once per session
+    import whisper  # pylint: disable=import-outside-toplevel
+
+    return whisper.load_model(model_name, device="cpu")
+
+
+class WhisperBackend(Backend):
+    batch_size = 8
+    max_concurrency = 1
+
+    def __init__(
+        self, language: str, model_name: str, word_timestamps: bool
+    ) -> None:
+        import whisper  # pylint: disable=import-outside-toplevel
+
+        self.name = f"whisper-{model_name}"
+        self.whisper = whisper
+        self.model = load_whisper_model(model_name)
+        self.language = None if language == "auto" else language
+        self.word_timestamps = word_timestamps
+        if word_timestamps:
+            self.name += "-words"
+            self.batch_size = 1
+        self.options = whisper.DecodingOptions(
+            language=self.language, without_timestamps=True, fp16=False
+        )
+
+    def recognize(
+        self, segments: T.List[sr.AudioData], timeout: T.Optional[float]
+    ) -> T.List[T.Optional[Result]]:
+        if self.word_timestamps:
+            return [self.transcribe(segment) for segment in segments]
+        return self.decode(segments)
+
+    def transcribe(self, segment: sr.AudioData) -> T.Optional[Result]:
+        # word timestamps need the full transcription pipeline, which works
+        # on one segment at a time
+        transcription = self.model.transcribe(
+            get_float_samples(segment),
+            language=self.language,
+            word_timestamps=True,
+            fp16=False,
+        )
+        text = transcription["text"].strip()
+        if not text:
+            return None
+        return Result(
+            text=text,
+            words=[
+                Word(
+                    text=word["word"].strip(),
+                    start=int(word["start"] * 1000),
+                    end=int(word["end"] * 1000),
+                )
+                for chunk in transcription["segments"]
+                for word in chunk.get("words", [])
+            ],
+        )
+
+    def decode(
+        self, segments: T.List[sr.AudioData]
+    ) -> T.List[T.Optional[Result]]:
+        import torch  # pylint: disable=import-outside-toplevel
+
+        # whisper takes 30 s windows; lines are much shorter than that, so
+        # each one gets its own window and they're decoded in one batch
+        mel = torch.stack(
+            [
+                self.whisper.log_mel_spectrogram(
+                    self.whisper.pad_or_trim(get_float_samples(segment)),
+                    n_mels=self.model.dims.n_mels,
+                )
+                for segment in segments
+            ]
+        )
+        results = self.whisper.decode(self.model, mel, self.options)
+        return [
+            Result(result.text.strip()) if result.text.strip() else None
+            for result in results
+        ]
+
+
+def get_float_samples(segment: sr.AudioData) -> np.ndarray:
+    raw_data = segment.get_raw_data(convert_rate=16000, convert_width=2)
+    return np.frombuffer(raw_data, dtype=np.int16).astype(np.float32) / 32768
+
+
+BACKENDS = ["google", "whisper"]
+
+
+def create_backend(
+    name: str,
+    language: str,
+    model_name: T.Optional[str],
+    word_timestamps: bool,
+) -> Backend:
+    if name == "google":
+        return GoogleBackend(language)
+    if name == "whisper":
+        return WhisperBackend(language, model_name or "small", word_timestamps)
+    raise ValueError(f"unknown backend: {name}")
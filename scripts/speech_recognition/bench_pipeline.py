@@ -0,0 +1,55 @@
+# Throughput of the speech recognition pipeline against a fake backend for
+# a range of --max-workers values, without hitting the network. Kept out of
+# the regular test run:
+#
+#   pytest speech_recognition/bench_pipeline.py -s
+import asyncio
+import typing as T
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+LINE_COUNT = 100
+MAX_WORKERS = [1, 2, 5, 10, 20]
+
+
+@pytest.mark.parametrize("max_workers", MAX_WORKERS)
+def test_pipeline(
+    benchmark: T.Any, plugin: T.Any, tmp_path: Path, max_workers: int
+) -> None:
+    # the plugin is loaded under another name by conftest.py, so that it
+    # doesn't shadow the speech_recognition library
+    subtitles = plugin.fake.get_subtitles(LINE_COUNT)
+    command = plugin.fake.create_command(
+        tmp_path,
+        duration=subtitles[-1].end + 1000,
+        max_workers=max_workers,
+    )
+    backend = plugin.fake.FakeBackend(
+        latency=0.1, jitter=0.05, error_rate=0.02
+    )
+    latencies = plugin.metrics.LatencyHistogram()
+
+    benchmark.group = "sr pipeline"
+    benchmark.pedantic(
+        lambda: asyncio.run(
+            command.run_on_subtitles(subtitles, backend, latencies)
+        ),
+        rounds=1,
+        iterations=1,
+    )
+
+    lines_per_sec = LINE_COUNT / benchmark.stats.stats.mean
+    benchmark.extra_info.update(
+        lines_per_sec=lines_per_sec,
+        p50=latencies.percentile(50),
+        p95=latencies.percentile(95),
+        p99=latencies.percentile(99),
+    )
+    print(
+        f"\n--max-workers {max_workers}: {lines_per_sec:.1f} lines/s, "
+        + latencies.format()[0]
+    )
+    assert all(subtitle.note for subtitle in subtitles)
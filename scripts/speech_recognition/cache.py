@@ -0,0 +1,92 @@
+import hashlib
+import sqlite3
+import time
+import typing as T
+from pathlib import Path
+
+MISSING = object()
+# bump whenever the layout or the meaning of the stored results changes;
+# the cache is thrown away rather than migrated
+SCHEMA_VERSION = 1
+
+
+def get_cache_key(
+    frame_data: T.Union[bytes, memoryview],
+    sample_rate: int,
+    sample_width: int,
+    language: str,
+    backend: str,
+) -> str:
+    digest = hashlib.sha256(frame_data)
+    digest.update(
+        f"{sample_rate}:{sample_width}:{language}:{backend}".encode()
+    )
+    return digest.hexdigest()
+
+
+class RecognitionCache:
+    def __init__(self, path: Path, max_size: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(str(path))
+        # results are written from the UI thread one at a time, so skip the
+        # fsync on every commit; losing the last few results is harmless
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                # older databases held notes in a "note" column
+                self._conn.execute("DROP TABLE IF EXISTS results")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result TEXT, last_used REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> T.Any:
+        # None is a valid result: the audio wasn't recognized
+        row = self._conn.execute(
+            "SELECT result FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        with self._conn:
+            self._conn.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return row[0]
+
+    def put(self, key: str, result: T.Optional[str]) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, result, time.time()),
+            )
+
+    def clear(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM results")
+
+    def evict(self) -> int:
+        # drop the least recently used results over the limit
+        with self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM results WHERE key NOT IN ("
+                "SELECT key FROM results ORDER BY last_used DESC LIMIT ?)",
+                (self.max_size,),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,69 @@
+import importlib
+import importlib.util
+import sys
+import types
+import typing as T
+from pathlib import Path
+
+import pytest
+
+PLUGIN_DIR = Path(__file__).parent
+PLUGIN_NAME = "plugin_speech_recognition"
+
+
+def is_library_module(name: str) -> bool:
+    return name == "speech_recognition" or name.startswith(
+        "speech_recognition."
+    )
+
+
+def load_plugin() -> types.ModuleType:
+    # pytest imports this directory as "speech_recognition", which hides the
+    # library of the same name from the plugin; load another copy under a
+    # name of its own, as bubblesub does, with the library put back in place
+    # while it's being imported
+    if PLUGIN_NAME in sys.modules:
+        importlib.import_module(f"{PLUGIN_NAME}.fake")
+        return sys.modules[PLUGIN_NAME]
+    plugin_modules = {
+        name: sys.modules.pop(name)
+        for name in list(sys.modules)
+        if is_library_module(name)
+    }
+    sys_path = sys.path.copy()
+    sys.path[:] = [
+        path
+        for path in sys.path
+        if Path(path or ".").resolve() != PLUGIN_DIR.parent.resolve()
+    ]
+    try:
+        importlib.import_module("speech_recognition")
+        spec = importlib.util.spec_from_file_location(
+            PLUGIN_NAME,
+            PLUGIN_DIR / "__init__.py",
+            submodule_search_locations=[str(PLUGIN_DIR)],
+        )
+        assert spec and spec.loader
+        plugin = importlib.util.module_from_spec(spec)
+        sys.modules[PLUGIN_NAME] = plugin
+        try:
+            spec.loader.exec_module(plugin)
+            importlib.import_module(f"{PLUGIN_NAME}.fake")
+        except BaseException:
+            del sys.modules[PLUGIN_NAME]
+            raise
+        return plugin
+    finally:
+        for name in list(sys.modules):
+            if is_library_module(name):
+                del sys.modules[name]
+        sys.modules.update(plugin_modules)
+        sys.path[:] = sys_path
+
+
+@pytest.fixture(name="plugin", scope="session")
+def fixture_plugin() -> T.Any:
+    try:
+        return load_plugin()
+    except ImportError as ex:
+        pytest.skip(f"{ex.name} is not installed")
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import random
+import threading
+import time
+import typing as T
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import speech_recognition as sr  # pylint: disable=import-self
+
+from . import SpeechRecognitionCommand
+from .backends import Backend
+from .segments import Result
+
+
+class FakeBackend(Backend):
+    # a stand-in for the real engines to measure the pipeline without
+    # hitting the network
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        unrecognized_rate: float = 0.0,
+        batch_size: int = 1,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.unrecognized_rate = unrecognized_rate
+        self.batch_size = batch_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def recognize(
+        self, segments: T.List[sr.AudioData], timeout: T.Optional[float]
+    ) -> T.List[T.Optional[Result]]:
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            failed = self._random.random() < self.error_rate
+            unrecognized = [
+                self._random.random() < self.unrecognized_rate
+                for _ in segments
+            ]
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("fake timeout")
+        time.sleep(delay)
+        if failed:
+            raise sr.RequestError("fake error")
+        return [
+            (
+                None
+                if skip
+                else Result(f"{len(segment.frame_data)} bytes of audio")
+            )
+            for segment, skip in zip(segments, unrecognized)
+        ]
+
+
+class SyntheticAudioStream:
+    # quacks like bubblesub's audio stream as far as decoding goes
+    def __init__(
+        self,
+        duration: int,
+        sample_rate: int = 48000,
+        channel_count: int = 2,
+        dtype: T.Any = np.int16,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.sample_count = duration * sample_rate // 1000
+        self.dtype = np.dtype(dtype)
+        self.is_ready = True
+
+    def get_samples(self, start_frame: int, count: int) -> np.ndarray:
+        # a tone that changes pitch every second, so every line gets
+        # different audio
+        frames = np.arange(start_frame, start_frame + count)
+        pitch = 200 + 50 * (frames // self.sample_rate % 10)
+        wave = 0.5 * np.sin(2 * np.pi * pitch * frames / self.sample_rate)
+        if np.issubdtype(self.dtype, np.integer):
+            wave = wave * np.iinfo(self.dtype).max
+        samples = np.repeat(wave[:, np.newaxis], self.channel_count, axis=1)
+        return samples.astype(self.dtype)
+
+
+class FakeLog:
+    def __init__(self) -> None:
+        self.messages: T.List[T.Tuple[str, str]] = []
+
+    def info(self, text: str) -> None:
+        self.messages.append(("info", text))
+
+    def warn(self, text: str) -> None:
+        self.messages.append(("warn", text))
+
+    def error(self, text: str) -> None:
+        self.messages.append(("error", text))
+
+
+def get_subtitles(count: int) -> T.List[T.Any]:
+    # just what the pipeline reads and writes of the real events
+    subtitles: T.List[T.Any] = []
+    start = 0
+    for idx in range(count):
+        end = start + 1000 + idx % 3 * 700
+        subtitles.append(
+            SimpleNamespace(
+                start=start, end=end, note="", index=idx, number=idx + 1
+            )
+        )
+        start = end + 500
+    return subtitles
+
+
+def create_command(
+    cache_dir: Path,
+    duration: int,
+    subs_path: T.Optional[Path] = None,
+    **kwargs: T.Any,
+) -> SpeechRecognitionCommand:
+    api = SimpleNamespace(
+        log=FakeLog(),
+        undo=SimpleNamespace(capture=contextlib.nullcontext),
+        audio=SimpleNamespace(
+            current_stream=SyntheticAudioStream(duration=duration)
+        ),
+        cfg=SimpleNamespace(opt={"plugins": {"sr_cache_dir": cache_dir}}),
+        subs=SimpleNamespace(path=subs_path),
+    )
+    # the pipeline only needs the api and the parsed arguments
+    command = SpeechRecognitionCommand.__new__(SpeechRecognitionCommand)
+    command.api = api
+    command.args = argparse.Namespace(
+        **{
+            "code": "ja",
+            "max_workers": 5,
+            "timeout": None,
+            "rate": None,
+            "retries": 3,
+            "merge_gap": 0,
+            "merge_max_duration": 10000,
+            "normalize": False,
+            "clear_cache": True,
+            "resume": False,
+            **kwargs,
+        }
+    )
+    return command
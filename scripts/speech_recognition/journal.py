@@ -0,0 +1,78 @@
+import enum
+import json
+import typing as T
+from pathlib import Path
+
+
+class Status(enum.Enum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+
+
+class Entry(T.NamedTuple):
+    status: Status
+    # None for lines that are done but weren't recognized
+    note: T.Optional[str] = None
+
+
+def get_job_key(
+    language: str, backend: str, index: int, start: int, end: int
+) -> str:
+    # a retimed line needs to be recognized again anyway; the index tells
+    # apart lines with the same timing, such as a dialogue and a sign
+    return f"{language}:{backend}:{index}:{start}-{end}"
+
+
+class JobJournal:
+    # an append-only log: every status change is written out right away, so
+    # a crash loses at most the line being written
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries: T.Dict[str, Entry] = {}
+        if path.exists():
+            with path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        obj = json.loads(line)
+                        self.entries[obj["key"]] = Entry(
+                            Status(obj["status"]), obj.get("note")
+                        )
+                    except (ValueError, KeyError):
+                        continue  # a line cut short by a crash
+
+        # compact the log while at it
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as self._handle:
+            for key, entry in self.entries.items():
+                self._write(key, entry)
+        tmp_path.replace(path)
+        self._handle = path.open("a", encoding="utf-8")
+
+    def get(self, key: str) -> T.Optional[Entry]:
+        return self.entries.get(key)
+
+    def set(
+        self, key: str, status: Status, note: T.Optional[str] = None
+    ) -> None:
+        entry = Entry(status, note)
+        self.entries[key] = entry
+        self._write(key, entry)
+        self._handle.flush()
+
+    def count(self, keys: T.Iterable[str], status: Status) -> int:
+        return sum(
+            1
+            for key in keys
+            if key in self.entries and self.entries[key].status == status
+        )
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def _write(self, key: str, entry: Entry) -> None:
+        obj = {"key": key, "status": entry.status.value}
+        if entry.note is not None:
+            obj["note"] = entry.note
+        self._handle.write(json.dumps(obj, ensure_ascii=False) + "\n")
@@ -0,0 +1,52 @@
+import bisect
+import math
+import typing as T
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16]
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.latencies: T.List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.latencies)
+
+    def record(self, latency: float) -> None:
+        self.latencies.append(latency)
+
+    def percentile(self, percent: float) -> float:
+        # nearest-rank percentile
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        rank = math.ceil(percent / 100 * len(latencies))
+        return latencies[max(0, rank - 1)]
+
+    def get_bucket_counts(self) -> T.List[int]:
+        # the last bucket holds everything above the highest bound
+        counts = [0] * (len(BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect.bisect_left(BUCKETS, latency)] += 1
+        return counts
+
+    def format(self) -> T.List[str]:
+        if not self.latencies:
+            return ["latency: no requests"]
+        lines = [
+            f"latency: {len(self)} requests, "
+            f"p50 {self.percentile(50):.2f} s, "
+            f"p95 {self.percentile(95):.2f} s, "
+            f"p99 {self.percentile(99):.2f} s"
+        ]
+        counts = self.get_bucket_counts()
+        width = max(counts)
+        for idx, count in enumerate(counts):
+            if idx < len(BUCKETS):
+                label = f"≤{BUCKETS[idx]:g} s"
+            else:
+                label = f">{BUCKETS[-1]:g} s"
+            bar = "#" * math.ceil(20 * count / width)
+            lines.append(f"{label:>8} {count:6} {bar}")
+        return lines
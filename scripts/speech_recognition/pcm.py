@@ -0,0 +1,126 @@
+import bisect
+import math
+import typing as T
+
+import numpy as np
+
+
+def get_covering_ranges(
+    ranges: T.Iterable[T.Tuple[int, int]],
+) -> T.List[T.Tuple[int, int]]:
+    result: T.List[T.Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if result and start <= result[-1][1]:
+            result[-1] = (result[-1][0], max(result[-1][1], end))
+        else:
+            result.append((start, end))
+    return result
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    if np.issubdtype(samples.dtype, np.floating):
+        return samples.astype(np.float32, copy=False)
+    info = np.iinfo(samples.dtype)
+    if info.min == 0:  # unsigned 8-bit samples are centered around 128
+        return (samples.astype(np.float32) - (info.max + 1) / 2) / (
+            (info.max + 1) / 2
+        )
+    return samples.astype(np.float32) / -info.min
+
+
+def to_mono(samples: np.ndarray, channel_count: int) -> np.ndarray:
+    samples = samples.reshape(-1, channel_count)
+    if channel_count == 1:
+        return samples[:, 0]
+    # a matrix-vector product is an order of magnitude faster than mean()
+    return samples @ np.full(channel_count, 1 / channel_count, np.float32)
+
+
+def get_lowpass_kernel(cutoff: float, tap_count: int) -> np.ndarray:
+    # windowed sinc; cutoff is relative to the sample rate
+    n = np.arange(tap_count) - (tap_count - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(tap_count)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(
+    samples: np.ndarray, sample_rate: int, target_rate: int
+) -> np.ndarray:
+    # only ever downsamples; speech needs nothing above 8 kHz
+    if sample_rate <= target_rate:
+        return samples
+    ratio = sample_rate / target_rate
+    kernel = get_lowpass_kernel(
+        cutoff=0.45 / ratio, tap_count=16 * math.ceil(ratio) + 1
+    )
+    samples = np.convolve(samples, kernel, mode="same")
+    if sample_rate % target_rate == 0:
+        return np.ascontiguousarray(samples[:: sample_rate // target_rate])
+    positions = np.arange(int(len(samples) / ratio)) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(
+        np.float32
+    )
+
+
+def normalize_peak(samples: np.ndarray, peak: float = 0.9) -> np.ndarray:
+    current_peak = np.abs(samples).max(initial=0)
+    if not current_peak:
+        return samples
+    return samples * np.float32(peak / current_peak)
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    # speech_recognition only understands integer samples
+    return (
+        (np.clip(samples, -1.0, 1.0) * np.iinfo(np.int16).max)
+        .round()
+        .astype(np.int16)
+    )
+
+
+def normalize_int16(samples: np.ndarray) -> np.ndarray:
+    return to_int16(normalize_peak(to_float(samples)))
+
+
+def preprocess(
+    samples: np.ndarray,
+    channel_count: int,
+    sample_rate: int,
+    target_rate: int,
+) -> np.ndarray:
+    # returns mono 16-bit samples at the target rate (or below)
+    samples = to_mono(to_float(samples), channel_count)
+    return to_int16(resample(samples, sample_rate, target_rate))
+
+
+class PcmBuffer:
+    def __init__(
+        self, samples: np.ndarray, sample_rate: int, start: int
+    ) -> None:
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.start = start
+
+    @property
+    def sample_width(self) -> int:
+        return self.samples.dtype.itemsize
+
+    def get_frame_idx(self, pts: int) -> int:
+        frame_idx = (pts - self.start) * self.sample_rate // 1000
+        return min(len(self.samples), max(0, frame_idx))
+
+    def get_samples(self, start: int, end: int) -> np.ndarray:
+        # a view, not a copy
+        return self.samples[
+            self.get_frame_idx(start) : self.get_frame_idx(end)
+        ]
+
+
+class PcmBufferIndex:
+    def __init__(self, buffers: T.Iterable[PcmBuffer]) -> None:
+        self.buffers = sorted(buffers, key=lambda buffer: buffer.start)
+        self.starts = [buffer.start for buffer in self.buffers]
+
+    def find(self, pts: int) -> PcmBuffer:
+        idx = bisect.bisect_right(self.starts, pts) - 1
+        return self.buffers[max(0, idx)]
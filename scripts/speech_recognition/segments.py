@@ -0,0 +1,127 @@
+import bisect
+import itertools
+import json
+import typing as T
+
+
+class Word(T.NamedTuple):
+    text: str
+    # relative to the start of the recognized audio
+    start: int
+    end: int
+
+
+class Result(T.NamedTuple):
+    text: str
+    words: T.Optional[T.List[Word]] = None
+
+
+def dump_result(result: T.Optional[Result]) -> T.Optional[str]:
+    if result is None:
+        return None
+    return json.dumps(
+        {
+            "text": result.text,
+            "words": (
+                None
+                if result.words is None
+                else [list(word) for word in result.words]
+            ),
+        }
+    )
+
+
+def load_result(data: T.Optional[str]) -> T.Optional[Result]:
+    if data is None:
+        return None
+    obj = json.loads(data)
+    return Result(
+        text=obj["text"],
+        words=(
+            None
+            if obj["words"] is None
+            else [Word(*word) for word in obj["words"]]
+        ),
+    )
+
+
+def group_ranges(
+    ranges: T.Sequence[T.Tuple[int, int]], max_gap: int, max_duration: int
+) -> T.List[T.List[int]]:
+    # returns indices of ranges that are close enough to each other to be
+    # recognized together; ranges that are too long stay on their own
+    groups: T.List[T.List[int]] = []
+    group_start = group_end = 0
+    for idx in sorted(range(len(ranges)), key=lambda idx: ranges[idx]):
+        start, end = ranges[idx]
+        if (
+            groups
+            and start - group_end < max_gap
+            and max(end, group_end) - group_start <= max_duration
+        ):
+            groups[-1].append(idx)
+            group_end = max(group_end, end)
+        else:
+            groups.append([idx])
+            group_start, group_end = start, end
+    return groups
+
+
+def _get_separator(text: str) -> str:
+    # languages such as Japanese don't separate words with spaces
+    return " " if " " in text.strip() else ""
+
+
+def _split_by_word_timestamps(
+    result: Result, spans: T.Sequence[T.Tuple[int, int]]
+) -> T.List[T.List[str]]:
+    assert result.words is not None
+    parts: T.List[T.List[str]] = [[] for _ in spans]
+    for word in result.words:
+        # the span containing the middle of the word, or the closest one
+        middle = (word.start + word.end) / 2
+        best_idx = min(
+            range(len(spans)),
+            key=lambda idx: max(
+                spans[idx][0] - middle, middle - spans[idx][1]
+            ),
+        )
+        parts[best_idx].append(word.text.strip())
+    return parts
+
+
+def _split_by_duration(
+    result: Result, spans: T.Sequence[T.Tuple[int, int]]
+) -> T.List[T.List[str]]:
+    separator = _get_separator(result.text)
+    tokens = result.text.split() if separator else list(result.text.strip())
+    durations = [max(0, end - start) for start, end in spans]
+    total = sum(durations)
+    if not total:
+        durations = [1] * len(spans)
+        total = len(spans)
+    bounds = list(itertools.accumulate(durations))
+
+    parts: T.List[T.List[str]] = [[] for _ in spans]
+    for idx, token in enumerate(tokens):
+        position = (idx + 0.5) * total / len(tokens)
+        span_idx = min(bisect.bisect_left(bounds, position), len(spans) - 1)
+        parts[span_idx].append(token)
+    return parts
+
+
+def split_result(
+    result: T.Optional[Result], spans: T.Sequence[T.Tuple[int, int]]
+) -> T.List[T.Optional[str]]:
+    # spans are the ranges of the source lines, relative to the start of
+    # the recognized audio
+    if result is None:
+        return [None for _ in spans]
+    if len(spans) == 1:
+        return [result.text]
+    if result.words:
+        parts = _split_by_word_timestamps(result, spans)
+    else:
+        parts = _split_by_duration(result, spans)
+    separator = _get_separator(result.text)
+    return [separator.join(part) or None for part in parts]
@@ -0,0 +1,11 @@
+import typing as T
+
+import pytest
+
+
+def test_incomplete_backend(plugin: T.Any) -> None:
+    class IncompleteBackend(plugin.backends.Backend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from .cache import MISSING, RecognitionCache, get_cache_key
+
+
+def test_get_cache_key() -> None:
+    key = get_cache_key(b"\x00\x01", 16000, 2, "ja", "google")
+    assert key == get_cache_key(
+        memoryview(b"\x00\x01"), 16000, 2, "ja", "google"
+    )
+    assert key != get_cache_key(b"\x00\x02", 16000, 2, "ja", "google")
+    assert key != get_cache_key(b"\x00\x01", 16000, 2, "en", "google")
+    assert key != get_cache_key(b"\x00\x01", 16000, 2, "ja", "whisper")
+    assert key != get_cache_key(b"\x00\x01", 8000, 2, "ja", "google")
+
+
+def test_recognition_cache(tmp_path: Path) -> None:
+    cache = RecognitionCache(tmp_path / "cache.sqlite", max_size=10)
+    assert cache.get("a") is MISSING
+    cache.put("a", "text")
+    cache.put("b", None)
+    assert cache.get("a") == "text"
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.hit_rate == 2 / 3
+    cache.close()
+
+    cache = RecognitionCache(tmp_path / "cache.sqlite", max_size=10)
+    assert cache.get("a") == "text"
+    cache.clear()
+    assert cache.get("a") is MISSING
+
+
+def test_recognition_cache_evict(tmp_path: Path) -> None:
+    cache = RecognitionCache(tmp_path / "cache.sqlite", max_size=2)
+    for key in "abc":
+        cache.put(key, key)
+        time.sleep(0.01)
+    cache.get("a")
+    assert cache.evict() == 1
+    assert cache.get("a") == "a"
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == "c"
+
+
+def test_recognition_cache_old_schema(tmp_path: Path) -> None:
+    conn = sqlite3.connect(str(tmp_path / "cache.sqlite"))
+    with conn:
+        conn.execute(
+            "CREATE TABLE results ("
+            "key TEXT PRIMARY KEY, note TEXT, last_used REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO results VALUES ('a', 'note', 0)")
+    conn.close()
+
+    cache = RecognitionCache(tmp_path / "cache.sqlite", max_size=10)
+    assert cache.get("a") is MISSING
+    cache.put("a", "text")
+    cache.close()
+
+    cache = RecognitionCache(tmp_path / "cache.sqlite", max_size=10)
+    assert cache.get("a") == "text"
+    cache.close()
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from .journal import Entry, JobJournal, Status, get_job_key
+
+
+def test_job_journal(tmp_path: Path) -> None:
+    path = tmp_path / "journal.jsonl"
+    journal = JobJournal(path)
+    assert journal.get("a") is None
+    journal.set("a", Status.PENDING)
+    journal.set("b", Status.PENDING)
+    journal.set("a", Status.DONE, "テスト")
+    journal.set("b", Status.TIMEOUT)
+    # no close(): every change should already be on disk
+
+    journal = JobJournal(path)
+    assert journal.get("a") == Entry(Status.DONE, "テスト")
+    assert journal.get("b") == Entry(Status.TIMEOUT)
+    assert journal.count(["a", "b", "c"], Status.DONE) == 1
+    journal.close()
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_job_journal_truncated_line(tmp_path: Path) -> None:
+    path = tmp_path / "journal.jsonl"
+    path.write_text(
+        '{"key": "a", "status": "done", "note": "x"}\n{"key": "b", "sta',
+        encoding="utf-8",
+    )
+    journal = JobJournal(path)
+    assert journal.get("a") == Entry(Status.DONE, "x")
+    assert journal.get("b") is None
+    journal.close()
+
+
+def test_get_job_key() -> None:
+    key = get_job_key("ja", "google", 0, 0, 100)
+    assert key != get_job_key("ja", "google", 0, 0, 101)
+    assert key != get_job_key("en", "google", 0, 0, 100)
+    assert key != get_job_key("ja", "whisper-small", 0, 0, 100)
+    assert key != get_job_key("ja", "google", 1, 0, 100)
@@ -0,0 +1,35 @@
+from .metrics import BUCKETS, LatencyHistogram
+
+
+def test_latency_histogram_percentile() -> None:
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0
+    for latency in range(100, 0, -1):
+        histogram.record(latency / 100)
+    assert histogram.percentile(50) == 0.5
+    assert histogram.percentile(95) == 0.95
+    assert histogram.percentile(99) == 0.99
+    assert histogram.percentile(100) == 1
+
+
+def test_latency_histogram_buckets() -> None:
+    histogram = LatencyHistogram()
+    for latency in [0.05, 0.1, 0.3, 3, 100]:
+        histogram.record(latency)
+    counts = histogram.get_bucket_counts()
+    assert len(counts) == len(BUCKETS) + 1
+    assert counts[0] == 2
+    assert counts[2] == 1
+    assert counts[5] == 1
+    assert counts[-1] == 1
+
+
+def test_latency_histogram_format() -> None:
+    histogram = LatencyHistogram()
+    assert histogram.format() == ["latency: no requests"]
+    histogram.record(0.5)
+    lines = histogram.format()
+    assert (
+        lines[0] == "latency: 1 requests, p50 0.50 s, p95 0.50 s, p99 0.50 s"
+    )
+    assert len(lines) == len(BUCKETS) + 2
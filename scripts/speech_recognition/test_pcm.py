@@ -0,0 +1,121 @@
+import numpy as np
+
+from .pcm import (
+    PcmBuffer,
+    PcmBufferIndex,
+    get_covering_ranges,
+    normalize_int16,
+    normalize_peak,
+    preprocess,
+    resample,
+    to_float,
+    to_int16,
+    to_mono,
+)
+
+
+def test_get_covering_ranges() -> None:
+    assert get_covering_ranges([(50, 60), (0, 10), (5, 20), (20, 30)]) == [
+        (0, 30),
+        (50, 60),
+    ]
+
+
+def test_to_float() -> None:
+    samples = np.array([0, 16384, -32768], dtype=np.int16)
+    assert to_float(samples).tolist() == [0, 0.5, -1]
+    samples = np.array([128, 192, 0], dtype=np.uint8)
+    assert to_float(samples).tolist() == [0, 0.5, -1]
+    samples = np.array([0.25], dtype=np.float64)
+    assert to_float(samples).dtype == np.float32
+
+
+def test_to_mono() -> None:
+    samples = np.array([[1, 3], [-4, -2], [10, 11]], dtype=np.float32)
+    assert to_mono(samples, 2).tolist() == [2, -3, 10.5]
+    samples = np.array([1, 2, 3], dtype=np.float32)
+    assert to_mono(samples, 1).tolist() == [1, 2, 3]
+
+
+def test_to_int16() -> None:
+    samples = np.array([0.0, 0.5, -1.0, 2.0], dtype=np.float32)
+    assert to_int16(samples).tolist() == [0, 16384, -32767, 32767]
+
+
+def test_normalize_peak() -> None:
+    samples = np.array([0.1, -0.2], dtype=np.float32)
+    assert np.allclose(normalize_peak(samples, peak=0.8), [0.4, -0.8])
+    samples = np.zeros(3, dtype=np.float32)
+    assert normalize_peak(samples).tolist() == [0, 0, 0]
+
+
+def get_tone(frequency: float, sample_rate: int) -> np.ndarray:
+    time = np.arange(sample_rate) / sample_rate
+    return np.sin(2 * np.pi * frequency * time).astype(np.float32)
+
+
+def get_amplitude(samples: np.ndarray) -> float:
+    # skip the edges distorted by the filter
+    return float(np.abs(samples[1000:-1000]).max())
+
+
+def test_resample() -> None:
+    for sample_rate in [48000, 44100]:
+        speech = resample(get_tone(1000, sample_rate), sample_rate, 16000)
+        assert len(speech) == 16000
+        assert speech.dtype == np.float32
+        assert get_amplitude(speech) > 0.95
+        # would alias back into the audible range
+        noise = resample(get_tone(12000, sample_rate), sample_rate, 16000)
+        assert get_amplitude(noise) < 0.05
+
+    samples = get_tone(1000, 8000)
+    assert resample(samples, 8000, 16000) is samples
+
+
+def test_preprocess() -> None:
+    stereo = np.repeat(
+        (get_tone(440, 48000) * 10000).astype(np.int16)[:, np.newaxis],
+        2,
+        axis=1,
+    )
+    samples = preprocess(
+        stereo,
+        channel_count=2,
+        sample_rate=48000,
+        target_rate=16000,
+    )
+    assert samples.dtype == np.int16
+    assert samples.flags.c_contiguous
+    assert len(samples) == 16000
+    assert abs(int(np.abs(samples).max()) - 10000) < 50
+
+
+def test_normalize_int16() -> None:
+    # a quiet line next to a loud one in the same buffer
+    buffer = PcmBuffer(
+        np.array([100, -200, 30000, -30000], dtype=np.int16), 1000, start=0
+    )
+    samples = normalize_int16(buffer.get_samples(0, 2))
+    assert samples.dtype == np.int16
+    assert samples.tolist() == [round(0.45 * 32767), round(-0.9 * 32767)]
+    assert buffer.samples.tolist()[:2] == [100, -200]
+
+
+def test_pcm_buffer_get_samples() -> None:
+    buffer = PcmBuffer(np.arange(100, dtype=np.int16), 1000, start=50)
+    samples = buffer.get_samples(60, 70)
+    assert samples.tolist() == list(range(10, 20))
+    assert samples.base is buffer.samples
+    assert buffer.get_samples(0, 55).tolist() == list(range(5))
+    assert buffer.get_samples(140, 1000).tolist() == list(range(90, 100))
+
+
+def test_pcm_buffer_index() -> None:
+    first = PcmBuffer(np.zeros(10, dtype=np.int16), 1000, start=100)
+    second = PcmBuffer(np.zeros(10, dtype=np.int16), 1000, start=0)
+    index = PcmBufferIndex([first, second])
+    assert index.find(-10) is second
+    assert index.find(5) is second
+    assert index.find(100) is first
+    assert index.find(150) is first
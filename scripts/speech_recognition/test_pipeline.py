@@ -0,0 +1,165 @@
+import asyncio
+import time
+import typing as T
+from pathlib import Path
+
+import pytest
+
+
+def test_run_on_subtitles(plugin: T.Any, tmp_path: Path) -> None:
+    subtitles = plugin.fake.get_subtitles(5)
+    command = plugin.fake.create_command(
+        tmp_path, duration=subtitles[-1].end + 1000
+    )
+    backend = plugin.fake.FakeBackend(latency=0, jitter=0)
+    latencies = plugin.metrics.LatencyHistogram()
+    asyncio.run(command.run_on_subtitles(subtitles, backend, latencies))
+    assert all(
+        subtitle.note.endswith("bytes of audio") for subtitle in subtitles
+    )
+    assert len(latencies) == 5
+
+
+def run(command: T.Any, subtitles: T.List[T.Any], backend: T.Any) -> None:
+    asyncio.run(command.run_on_subtitles(subtitles, backend))
+
+
+def get_statuses(
+    command: T.Any, subtitles: T.List[T.Any], backend: T.Any
+) -> T.List[T.Any]:
+    journal = command.open_journal()
+    try:
+        return [
+            journal.get(command.get_subtitle_job_key(subtitle, backend)).status
+            for subtitle in subtitles
+        ]
+    finally:
+        journal.close()
+
+
+def test_run_on_subtitles_retries(
+    plugin: T.Any, tmp_path: Path, monkeypatch: T.Any
+) -> None:
+    monkeypatch.setattr(plugin, "RETRY_DELAY", 0)
+    subtitles = plugin.fake.get_subtitles(10)
+    command = plugin.fake.create_command(
+        tmp_path,
+        duration=subtitles[-1].end + 1000,
+        subs_path=tmp_path / "subs.ass",
+        retries=10,
+    )
+    backend = plugin.fake.FakeBackend(latency=0, jitter=0, error_rate=0.5)
+    run(command, subtitles, backend)
+    assert all(subtitle.note for subtitle in subtitles)
+    assert any(
+        level == "warn" and "error (fake error), retrying" in text
+        for level, text in command.api.log.messages
+    )
+    assert not any(
+        level == "error" for level, _text in command.api.log.messages
+    )
+    statuses = get_statuses(command, subtitles, backend)
+    assert statuses == [plugin.Status.DONE] * 10
+
+
+def test_run_on_subtitles_request_errors(
+    plugin: T.Any, tmp_path: Path, monkeypatch: T.Any
+) -> None:
+    monkeypatch.setattr(plugin, "RETRY_DELAY", 0)
+    subtitles = plugin.fake.get_subtitles(3)
+    command = plugin.fake.create_command(
+        tmp_path,
+        duration=subtitles[-1].end + 1000,
+        subs_path=tmp_path / "subs.ass",
+        retries=2,
+    )
+    backend = plugin.fake.FakeBackend(latency=0, jitter=0, error_rate=1)
+    run(command, subtitles, backend)
+    assert not any(subtitle.note for subtitle in subtitles)
+    messages = command.api.log.messages
+    for subtitle in subtitles:
+        assert (
+            "error",
+            f"line #{subtitle.number}: error (fake error)",
+        ) in messages
+    # two retries for every line
+    assert sum(1 for level, _text in messages if level == "warn") == 6
+    statuses = get_statuses(command, subtitles, backend)
+    assert statuses == [plugin.Status.FAILED] * 3
+    assert ("info", "run again with --resume to retry the rest") in messages
+
+
+def test_run_on_subtitles_timeout(plugin: T.Any, tmp_path: Path) -> None:
+    class StuckBackend(plugin.fake.FakeBackend):
+        # the first request hangs past its timeout, the others are quick
+        call_count = 0
+
+        def recognize(
+            self, segments: T.List[T.Any], timeout: T.Optional[float]
+        ) -> T.List[T.Any]:
+            self.call_count += 1
+            if self.call_count == 1:
+                time.sleep(0.5)
+            return super().recognize(segments, timeout)
+
+    subtitles = plugin.fake.get_subtitles(3)
+    command = plugin.fake.create_command(
+        tmp_path,
+        duration=subtitles[-1].end + 1000,
+        subs_path=tmp_path / "subs.ass",
+        max_workers=1,
+        timeout=0.2,
+    )
+    backend = StuckBackend(latency=0, jitter=0)
+    run(command, subtitles, backend)
+    # the lines queued behind the stuck request get their full timeout
+    assert [bool(subtitle.note) for subtitle in subtitles] == [
+        False,
+        True,
+        True,
+    ]
+    assert ("error", "line #1: timeout") in command.api.log.messages
+    statuses = get_statuses(command, subtitles, backend)
+    assert statuses == [
+        plugin.Status.TIMEOUT,
+        plugin.Status.DONE,
+        plugin.Status.DONE,
+    ]
+
+
+def test_run_on_subtitles_cancel(plugin: T.Any, tmp_path: Path) -> None:
+    class CountingBackend(plugin.fake.FakeBackend):
+        def __init__(self) -> None:
+            super().__init__(latency=0.2, jitter=0)
+            self.call_count = 0
+
+        def recognize(
+            self, segments: T.List[T.Any], timeout: T.Optional[float]
+        ) -> T.List[T.Any]:
+            self.call_count += 1
+            return super().recognize(segments, timeout)
+
+    subtitles = plugin.fake.get_subtitles(20)
+    command = plugin.fake.create_command(
+        tmp_path, duration=subtitles[-1].end + 1000, max_workers=2
+    )
+    backend = CountingBackend()
+
+    async def run_and_cancel() -> None:
+        task = asyncio.ensure_future(
+            command.run_on_subtitles(subtitles, backend)
+        )
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        call_count = backend.call_count
+        note_count = sum(1 for subtitle in subtitles if subtitle.note)
+        # neither the queued requests nor the ones still running go on
+        # to change anything
+        await asyncio.sleep(0.5)
+        assert backend.call_count == call_count
+        assert sum(1 for subtitle in subtitles if subtitle.note) == note_count
+        assert note_count < len(subtitles)
+
+    asyncio.run(run_and_cancel())
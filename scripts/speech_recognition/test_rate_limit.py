@@ -0,0 +1,25 @@
+from .rate_limit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_burst() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+
+
+def test_token_bucket_refill() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
+    clock.now = 0.5
+    assert bucket.reserve() == 0.5
+    clock.now = 10
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
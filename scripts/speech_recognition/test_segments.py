@@ -0,0 +1,80 @@
+from .segments import (
+    Result,
+    Word,
+    dump_result,
+    group_ranges,
+    load_result,
+    split_result,
+)
+
+
+def test_dump_result() -> None:
+    for result in [
+        None,
+        Result("a b"),
+        Result("a b", [Word("a", 0, 10), Word("b", 10, 20)]),
+    ]:
+        assert load_result(dump_result(result)) == result
+
+
+def test_group_ranges() -> None:
+    ranges = [(0, 500), (600, 900), (2000, 2500), (2550, 2600), (700, 800)]
+    assert group_ranges(ranges, max_gap=200, max_duration=10000) == [
+        [0, 1, 4],
+        [2, 3],
+    ]
+    assert group_ranges(ranges, max_gap=200, max_duration=800) == [
+        [0],
+        [1, 4],
+        [2, 3],
+    ]
+    assert group_ranges(ranges, max_gap=0, max_duration=10000) == [
+        [0],
+        [1, 4],
+        [2],
+        [3],
+    ]
+
+
+def test_split_result_single_span() -> None:
+    assert split_result(Result("a b c"), [(0, 100)]) == ["a b c"]
+    assert split_result(None, [(0, 100), (100, 200)]) == [None, None]
+
+
+def test_split_result_by_word_timestamps() -> None:
+    result = Result(
+        "yes no maybe",
+        [Word("yes", 0, 100), Word("no", 250, 450), Word("maybe", 900, 950)],
+    )
+    assert split_result(result, [(0, 200), (300, 800), (1000, 1100)]) == [
+        "yes",
+        "no",
+        "maybe",
+    ]
+    assert split_result(result, [(0, 500), (600, 800)]) == [
+        "yes no",
+        "maybe",
+    ]
+    assert split_result(result, [(0, 500), (1000, 1100), (2000, 2100)]) == [
+        "yes no",
+        "maybe",
+        None,
+    ]
+
+
+def test_split_result_by_duration() -> None:
+    result = Result("one two three four")
+    assert split_result(result, [(0, 100), (200, 500)]) == [
+        "one",
+        "two three four",
+    ]
+    assert split_result(result, [(0, 100), (100, 200)]) == [
+        "one two",
+        "three four",
+    ]
+
+
+def test_split_result_by_duration_without_spaces() -> None:
+    result = Result("はいいいえ")
+    assert split_result(result, [(0, 200), (200, 500)]) == ["はい", "いいえ"]
+    assert split_result(Result("a"), [(0, 100), (100, 200)]) == ["a", None]
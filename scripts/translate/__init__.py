@@ -1,117 +1,89 @@
 import argparse
 import asyncio
+import collections
+import concurrent.futures
+import os
 import time
 import typing as T
-from subprocess import PIPE, run
+from pathlib import Path
 
-import ass_tag_parser
 import requests
-from ass_parser import AssEvent
+from requests.adapters import HTTPAdapter
 
 from bubblesub.api import Api
 from bubblesub.api.cmd import BaseCommand
 from bubblesub.cfg.menu import MenuCommand, SubMenu
 from bubblesub.cmd.common import SubtitlesSelection
 
-MAX_CHUNKS = 50
-
-
-def divide_into_groups(
-    source: T.Sequence[T.Any], size: int
-) -> T.Iterable[T.Sequence[T.Any]]:
-    size = max(1, size)
-    return (source[i : i + size] for i in range(0, len(source), size))
-
-
-def translate(
+from .adaptive import AdaptiveController, Throttled
+from .batching import ENGINE_LIMITS, take_batch
+from .memory import TranslationMemory
+from .notes import (
+    NoteTracker,
+    ParsedNote,
+    append_text,
+    collect_text_chunks,
+    has_text,
+    parse_notes,
+    preprocess,
+    translate_note,
+)
+from .rate_limit import TokenBucket
+from .trans import get_trans_args, translate_trans
+
+DEEPL_API_URL = "https://api-free.deepl.com/v2/translate"
+REQUEST_TIMEOUT = 30
+# server errors are almost always the engine being overloaded too
+THROTTLED_STATUS_CODES = {429, 500, 502, 503, 504}
+# consecutive throttled or timed out requests after which a worker gives up
+MAX_THROTTLED = 5
+
+
+def translate_deepl(
     api: Api,
     lines: T.List[str],
-    engine: str,
     source_code: str,
     target_code: str,
-) -> str:
-    if not lines:
-        return []
-
-    if engine == "deepl":
-        api_key = api.cfg.opt.get("plugins", {}).get("deepl_api_key")
-        if not api_key:
-            raise ValueError("missing plugins.deepl_api_key option.")
-        response = requests.get(
-            "https://api-free.deepl.com/v2/translate",
+    session: requests.Session,
+    timeout: float,
+) -> T.List[str]:
+    options = api.cfg.opt.get("plugins", {})
+    api_key = options.get("deepl_api_key")
+    if not api_key:
+        raise ValueError("missing plugins.deepl_api_key option.")
+    try:
+        response = session.post(
+            options.get("deepl_api_url") or DEEPL_API_URL,
             data={
                 "auth_key": api_key,
                 "text": lines,
                 "source_lang": source_code.upper(),
                 "target_lang": target_code.upper(),
             },
+            timeout=timeout,
         )
-        response.raise_for_status()
-        return [
-            translation["text"]
-            for translation in response.json()["translations"]
-        ]
-
-    args = ["trans", "-b"]
-    args += ["-e", engine]
-    args += ["-s", source_code]
-    args += ["-t", target_code]
-    args += ["\n".join(lines)]
-    result = run(args, check=True, stdout=PIPE, stderr=PIPE)
-    response = result.stdout.decode().strip()
-    response = response.replace("u200b", "")
-    if not response:
-        raise ValueError("error")
-    return response.split("\n")
-
-
-def preprocess(chunk: str) -> str:
-    return chunk.replace("\n", " ").replace("\\N", " ")
-
-
-def postprocess(chunk: str) -> str:
-    return (
-        chunk.replace("...", "…")
-        .replace(" !", "!")
-        .replace(" ?", "?")
-        .replace(" …", "…")
-    )
-
-
-def collect_text_chunks(events: T.List[AssEvent]) -> T.Iterable[str]:
-    for event in events:
-        text = event.note
-        try:
-            ass_line = ass_tag_parser.parse_ass(text)
-        except ass_tag_parser.ParseError:
-            if text:
-                yield text
-        else:
-            for item in ass_line:
-                if isinstance(item, ass_tag_parser.AssText) and item.text:
-                    yield item.text
-
-
-def put_text_chunks(events: T.List[AssEvent], chunks: T.List[str]) -> None:
-    for event in events:
-        text = event.note
-        try:
-            ass_line = ass_tag_parser.parse_ass(text)
-        except ass_tag_parser.ParseError:
-            text = chunks.pop(0)
-        else:
-            text = ""
-            for item in ass_line:
-                if isinstance(item, ass_tag_parser.AssText) and item.text:
-                    text += chunks.pop(0)
-                else:
-                    text += item.meta.text
-        if not text:
-            continue
-        if event.text:
-            event.text += "\\N" + text
-        else:
-            event.text = text
+    except requests.Timeout:
+        raise TimeoutError("deepl timed out") from None
+    except requests.ConnectionError as ex:
+        # as likely to go away on a retry as a timeout
+        raise TimeoutError(f"connection error ({ex})") from None
+    if response.status_code in THROTTLED_STATUS_CODES:
+        retry_after = response.headers.get("Retry-After", "")
+        raise Throttled(float(retry_after) if retry_after.isdigit() else None)
+    response.raise_for_status()
+    return [
+        translation["text"] for translation in response.json()["translations"]
+    ]
+
+
+class TranslationContext(T.NamedTuple):
+    memory: TranslationMemory
+    executor: concurrent.futures.Executor
+    session: requests.Session
+    trans_args: T.Optional[T.List[str]]
+    rate_limiter: TokenBucket
+    controller: AdaptiveController
+    tracker: NoteTracker
 
 
 class GoogleTranslateCommand(BaseCommand):
@@ -123,54 +95,237 @@ class GoogleTranslateCommand(BaseCommand):
         return self.args.target.makes_sense
 
     async def run(self) -> None:
-        await asyncio.get_event_loop().run_in_executor(
-            None,
-            self.run_in_background,
-            await self.args.target.get_subtitles(),
-        )
-
-    def run_in_background(self, subs: T.List[AssEvent]) -> None:
-        chunks = list(map(preprocess, collect_text_chunks(subs)))
+        notes = parse_notes(await self.args.target.get_subtitles())
+        chunks = list(map(preprocess, collect_text_chunks(notes)))
 
         if not chunks:
             self.api.log.info("Nothing to translate")
             return
 
-        i = 0
-        translated_chunks: T.List[str] = []
-        chunks_groups = list(divide_into_groups(chunks, MAX_CHUNKS))
-        while chunks_groups:
-            chunks_group = chunks_groups.pop(0)
+        tracker = NoteTracker(notes)
+        memory = TranslationMemory(self.get_memory_path())
+        try:
+            finished = await self.translate_chunks(chunks, memory, tracker)
+        finally:
+            memory.close()
+
+        if finished:
+            self.api.log.info("OK")
+        else:
             self.api.log.info(
-                "translating chunks "
-                f"{i+1}..{i+len(chunks_group)}/{len(chunks)}..."
+                f"{tracker.done_count}/{len(notes)} lines translated, "
+                "run again with --resume to translate the rest"
             )
-            i += len(chunks_group)
 
-            try:
-                translated_lines = translate(
-                    self.api,
-                    chunks_group,
-                    self.args.engine,
-                    self.args.source_code,
-                    self.args.target_code,
-                )
-            except ValueError as ex:
-                self.api.log.error(f"error ({ex})")
-                return
-            translated_chunks.extend(map(postprocess, translated_lines))
+    async def translate_chunks(
+        self,
+        chunks: T.List[str],
+        memory: TranslationMemory,
+        tracker: NoteTracker,
+    ) -> bool:
+        translations = (
+            {}
+            if self.args.refresh
+            else memory.get_many(*self.translation_key, chunks)
+        )
+        self.api.log.info(
+            f"translation memory: {memory.hits} hits, {memory.misses} misses"
+        )
 
-            if chunks_groups:
-                time.sleep(self.args.sleep_time)
+        # whitespace between tags ends up empty after preprocessing
+        translations[""] = ""
+        self.apply_translations(tracker.add(translations), translations)
 
-        if len(translated_chunks) != len(chunks):
-            self.api.log.error("mismatching number of chunks")
-            return
+        # every occurrence of a repeated chunk gets its translation from
+        # the same dictionary entry, so send each one only once
+        missing_chunks = list(
+            dict.fromkeys(
+                chunk for chunk in chunks if chunk not in translations
+            )
+        )
+        self.api.log.info(
+            f"{len(chunks)} chunks, {len(set(chunks))} unique, "
+            f"{len(missing_chunks)} to translate"
+        )
+        if not missing_chunks:
+            return True
+
+        limits = ENGINE_LIMITS[self.args.engine]
+        batch_size, rate = memory.get_engine_parameters(self.args.engine) or (
+            None,
+            None,
+        )
+        controller = AdaptiveController(
+            limits,
+            batch_size=batch_size,
+            rate=self.args.rate or rate,
+            adapt_rate=not self.args.rate,
+        )
 
-        self.api.log.info("OK")
+        max_workers = self.args.max_workers
+        session = requests.Session()
+        # keep a connection open for every worker
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        context = TranslationContext(
+            memory=memory,
+            executor=concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers
+            ),
+            session=session,
+            trans_args=(
+                None
+                if self.args.engine == "deepl"
+                else get_trans_args(*self.translation_key)
+            ),
+            rate_limiter=TokenBucket(
+                rate=controller.rate, capacity=max_workers
+            ),
+            controller=controller,
+            tracker=tracker,
+        )
+        remaining_chunks = collections.deque(missing_chunks)
+        workers = [
+            asyncio.ensure_future(
+                self.translate_queue(remaining_chunks, translations, context)
+            )
+            for _ in range(max_workers)
+        ]
+        start_time = time.monotonic()
+        try:
+            await asyncio.gather(*workers)
+        except (
+            ValueError,
+            TimeoutError,
+            Throttled,
+            requests.RequestException,
+        ) as ex:
+            self.api.log.error(f"error ({ex})")
+            return False
+        finally:
+            for worker in workers:
+                worker.cancel()
+            context.executor.shutdown(wait=False, cancel_futures=True)
+            session.close()
+
+        # start off where this run left off next time; a failed run ends
+        # with the batch size and rate cut down by the errors, so it's
+        # not worth remembering
+        memory.put_engine_parameters(
+            self.args.engine,
+            controller.batch_size,
+            controller.rate if controller.adapt_rate else rate or limits.rate,
+        )
 
+        self.api.log.info(
+            f"{self.args.engine}: {controller.max_segments} chunks per batch, "
+            f"{controller.rate:.1f} requests/s, "
+            f"{len(missing_chunks) / (time.monotonic() - start_time):.1f} "
+            "chunks/s"
+        )
+        return True
+
+    async def translate_queue(
+        self,
+        chunks: T.Deque[str],
+        translations: T.Dict[str, str],
+        context: TranslationContext,
+    ) -> None:
+        controller = context.controller
+        throttled_count = 0
+        while chunks:
+            batch = take_batch(
+                chunks, controller.limits.max_bytes, controller.max_segments
+            )
+            await context.rate_limiter.acquire()
+            self.api.log.info(
+                f"translating {len(batch)} chunks ({len(chunks)} left)..."
+            )
+            start_time = time.monotonic()
+            try:
+                translated_lines = (
+                    await asyncio.get_event_loop().run_in_executor(
+                        context.executor, self.translate_batch, batch, context
+                    )
+                )
+            except (Throttled, TimeoutError) as ex:
+                # put the batch back for whichever worker is free first
+                chunks.extendleft(reversed(batch))
+                controller.on_throttled(start_time, time.monotonic())
+                context.rate_limiter.rate = controller.rate
+                throttled_count += 1
+                if throttled_count >= MAX_THROTTLED:
+                    raise
+                delay = (
+                    ex.retry_after if isinstance(ex, Throttled) else None
+                ) or 1 / controller.rate
+                self.api.log.warn(f"{ex}, retrying in {delay:.1f} s")
+                await asyncio.sleep(delay)
+                continue
+            throttled_count = 0
+            controller.on_success(time.monotonic() - start_time)
+            context.rate_limiter.rate = controller.rate
+
+            if len(translated_lines) != len(batch):
+                raise ValueError("mismatching number of chunks")
+
+            # store right away so that a failure later on loses nothing
+            context.memory.put_many(
+                *self.translation_key, zip(batch, translated_lines)
+            )
+            translations.update(zip(batch, translated_lines))
+            # apply while the other workers wait for their responses
+            self.apply_translations(context.tracker.add(batch), translations)
+
+    def apply_translations(
+        self, notes: T.List[ParsedNote], translations: T.Dict[str, str]
+    ) -> None:
+        texts = [
+            (note.event, translate_note(note, translations)) for note in notes
+        ]
+        texts = [
+            (event, text)
+            for event, text in texts
+            if text and not (self.args.resume and has_text(event, text))
+        ]
+        if not texts:
+            return
+        # an undo step per batch, so that a failure later on keeps what's
+        # already been applied
         with self.api.undo.capture():
-            put_text_chunks(subs, translated_chunks)
+            for event, text in texts:
+                append_text(event, text)
+
+    def translate_batch(
+        self, batch: T.List[str], context: TranslationContext
+    ) -> T.List[str]:
+        if context.trans_args:
+            return translate_trans(
+                context.trans_args, batch, self.args.timeout
+            )
+        return translate_deepl(
+            self.api,
+            batch,
+            self.args.source_code,
+            self.args.target_code,
+            context.session,
+            self.args.timeout,
+        )
+
+    @property
+    def translation_key(self) -> T.Tuple[str, str, str]:
+        return (
+            self.args.engine,
+            self.args.source_code,
+            self.args.target_code,
+        )
+
+    def get_memory_path(self) -> Path:
+        path = self.api.cfg.opt.get("plugins", {}).get("tl_memory_path")
+        if path:
+            return Path(path).expanduser()
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache_dir) / "bubblesub" / "translation_memory.sqlite"
 
     @staticmethod
     def decorate_parser(api: Api, parser: argparse.ArgumentParser) -> None:
@@ -189,11 +344,40 @@ class GoogleTranslateCommand(BaseCommand):
             default="google",
         )
         parser.add_argument(
-            "-s",
-            "--sleep-time",
-            help="time to sleep after each chunk",
+            "-m",
+            "--max-workers",
+            help="number of parallel requests",
             type=int,
-            default=3,
+            default=4,
+        )
+        parser.add_argument(
+            "-T",
+            "--timeout",
+            help="max request timeout in seconds",
+            type=float,
+            default=REQUEST_TIMEOUT,
+        )
+        parser.add_argument(
+            "-r",
+            "--rate",
+            help=(
+                "max number of requests per second (default: adapt to the "
+                "engine's response times and throttling)"
+            ),
+            type=float,
+        )
+        parser.add_argument(
+            "--refresh",
+            help="translate again chunks found in the translation memory",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--resume",
+            help=(
+                "skip the lines that already got their translation in a "
+                "previous run"
+            ),
+            action="store_true",
         )
         parser.add_argument(
             metavar="from", dest="source_code", help="source language code"
@@ -0,0 +1,61 @@
+import typing as T
+
+from .batching import EngineLimits
+
+# batches taking longer than that are too big
+TARGET_LATENCY = 5.0
+BATCH_SIZE_STEP = 2
+RATE_STEP = 0.2
+DECREASE_FACTOR = 0.5
+MIN_RATE = 0.1
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after: T.Optional[float] = None) -> None:
+        super().__init__("throttled by the engine")
+        self.retry_after = retry_after
+
+
+class AdaptiveController:
+    # additive increase, multiplicative decrease of the number of chunks
+    # per batch and of the number of requests per second
+    def __init__(
+        self,
+        limits: EngineLimits,
+        batch_size: T.Optional[float] = None,
+        rate: T.Optional[float] = None,
+        adapt_rate: bool = True,
+    ) -> None:
+        self.limits = limits
+        self.batch_size = min(
+            float(limits.max_segments),
+            max(1.0, batch_size or limits.max_segments / 2),
+        )
+        self.rate = min(limits.max_rate, max(MIN_RATE, rate or limits.rate))
+        self.adapt_rate = adapt_rate
+        self.last_decrease = float("-inf")
+
+    @property
+    def max_segments(self) -> int:
+        return int(self.batch_size)
+
+    def on_success(self, latency: float) -> None:
+        if latency > TARGET_LATENCY:
+            self.batch_size = max(1.0, self.batch_size * DECREASE_FACTOR)
+            return
+        self.batch_size = min(
+            float(self.limits.max_segments),
+            self.batch_size + BATCH_SIZE_STEP,
+        )
+        if self.adapt_rate:
+            self.rate = min(self.limits.max_rate, self.rate + RATE_STEP)
+
+    def on_throttled(self, start_time: float, now: float) -> None:
+        # concurrent requests tend to get throttled together; back off
+        # once for all the ones that were sent before the last backoff
+        if start_time < self.last_decrease:
+            return
+        self.last_decrease = now
+        self.batch_size = max(1.0, self.batch_size * DECREASE_FACTOR)
+        if self.adapt_rate:
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
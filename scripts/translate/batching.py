@@ -0,0 +1,47 @@
+import typing as T
+
+
+class EngineLimits(T.NamedTuple):
+    max_bytes: int
+    max_segments: int
+    # requests per second to start with and to never go above
+    rate: float
+    max_rate: float
+
+
+ENGINE_LIMITS = {
+    # the api takes up to 50 texts and 128 KiB per request; the texts are
+    # form-encoded, so leave room for percent-encoding of non-ascii text
+    "deepl": EngineLimits(
+        max_bytes=40_000, max_segments=50, rate=5, max_rate=20
+    ),
+    # trans puts the text into the query string of the web translators,
+    # which cut it off at around 5000 characters
+    "google": EngineLimits(
+        max_bytes=5000, max_segments=100, rate=1, max_rate=4
+    ),
+    "bing": EngineLimits(max_bytes=5000, max_segments=100, rate=1, max_rate=4),
+    "yandex": EngineLimits(
+        max_bytes=10000, max_segments=100, rate=1, max_rate=4
+    ),
+}
+
+
+def get_chunk_size(chunk: str) -> int:
+    # plus a newline or a form field separator
+    return len(chunk.encode()) + 1
+
+
+def take_batch(
+    chunks: T.Deque[str], max_bytes: int, max_segments: int
+) -> T.List[str]:
+    batch: T.List[str] = []
+    batch_size = 0
+    while chunks and len(batch) < max_segments:
+        chunk_size = get_chunk_size(chunks[0])
+        # a chunk over the limit on its own still goes in a batch of one
+        if batch and batch_size + chunk_size > max_bytes:
+            break
+        batch.append(chunks.popleft())
+        batch_size += chunk_size
+    return batch
@@ -0,0 +1,96 @@
+# End-to-end throughput of the translation command against a local fake of
+# the DeepL api and a fake trans executable, for files of various sizes,
+# without hitting the network. Kept out of the regular test run:
+#
+#   pytest translate/bench_pipeline.py -s
+import asyncio
+import contextlib
+import os
+import time
+import tracemalloc
+import typing as T
+from pathlib import Path
+
+import pytest
+from ass_parser import AssEvent
+
+from .fake import FakeDeepLServer, create_command, write_fake_trans
+from .notes import collect_text_chunks, parse_notes
+
+pytest.importorskip("pytest_benchmark")
+
+LINE_COUNTS = [1000, 10_000, 50_000]
+ENGINES = ["deepl", "google"]
+
+
+def get_subtitles(count: int) -> T.List[AssEvent]:
+    subtitles: T.List[AssEvent] = []
+    for idx in range(count):
+        # every fifth line repeats an earlier one, like songs and
+        # interjections do
+        number = idx // 5 if idx % 5 == 4 else idx
+        note = f"これは{number}行目のテキストです"
+        if idx % 7 == 0:
+            note = r"{\i1}" + note + r"{\i0}…ですよね？"
+        subtitles.append(AssEvent(note=note))
+    return subtitles
+
+
+class TimedUndoCapture:
+    # measures how long applying the translations takes
+    def __init__(self) -> None:
+        self.duration = 0.0
+
+    @contextlib.contextmanager
+    def __call__(self) -> T.Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.duration += time.perf_counter() - start_time
+
+
+@pytest.mark.parametrize("line_count", LINE_COUNTS)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_pipeline(
+    benchmark: T.Any,
+    tmp_path: Path,
+    monkeypatch: T.Any,
+    engine: str,
+    line_count: int,
+) -> None:
+    write_fake_trans(tmp_path)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    subtitles = get_subtitles(line_count)
+    chunk_count = len(list(collect_text_chunks(parse_notes(subtitles))))
+    undo_capture = TimedUndoCapture()
+
+    with FakeDeepLServer(max_rate=10) as server:
+        command = create_command(
+            tmp_path, server, subtitles, undo_capture, engine=engine
+        )
+        tracemalloc.start()
+        benchmark.group = f"tl pipeline, {line_count} lines"
+        try:
+            benchmark.pedantic(
+                lambda: asyncio.run(command.run()), rounds=1, iterations=1
+            )
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    chunks_per_sec = chunk_count / benchmark.stats.stats.mean
+    benchmark.extra_info.update(
+        chunks_per_sec=chunks_per_sec,
+        peak_memory=peak_memory,
+        apply_time=undo_capture.duration,
+        throttled=server.throttled_count,
+    )
+    print(
+        f"\n{engine}, {line_count} lines: {chunks_per_sec:.0f} chunks/s, "
+        f"peak memory {peak_memory / 1024 / 1024:.1f} MiB, "
+        f"apply {undo_capture.duration:.2f} s, "
+        f"{server.request_count} requests, "
+        f"{server.throttled_count} throttled"
+    )
+    assert all(subtitle.text for subtitle in subtitles)
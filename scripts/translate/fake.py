@@ -0,0 +1,224 @@
+import argparse
+import collections
+import contextlib
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import typing as T
+import urllib.parse
+from pathlib import Path
+from types import SimpleNamespace
+
+from ass_parser import AssEvent
+
+from . import GoogleTranslateCommand
+
+# what the real api accepts in a single request
+MAX_TEXTS = 50
+MAX_BYTES = 128 * 1024
+
+# stands in for trans -b: translates every line of the text it's given,
+# one request per call
+FAKE_TRANS = """#!{python}
+import sys
+import time
+
+target_code = sys.argv[sys.argv.index("-t") + 1]
+time.sleep({latency})
+for line in sys.argv[-1].split("\\n"):
+    print(f"[{{target_code}}] {{line}}")
+"""
+
+
+def fake_translate(text: str, target_code: str) -> str:
+    return f"[{target_code}] {text}"
+
+
+def write_fake_trans(directory: Path, latency: float = 0.05) -> Path:
+    path = directory / "trans"
+    path.write_text(FAKE_TRANS.format(python=sys.executable, latency=latency))
+    path.chmod(0o755)
+    return path
+
+
+class FakeDeepLServer:
+    # serves deepl's /v2/translate on localhost to measure the plugin
+    # without hitting the network
+    def __init__(
+        self,
+        api_key: str = "fake",
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        max_rate: T.Optional[float] = None,
+        max_texts: int = MAX_TEXTS,
+        max_bytes: int = MAX_BYTES,
+        seed: int = 0,
+    ) -> None:
+        self.api_key = api_key
+        self.latency = latency
+        self.jitter = jitter
+        self.max_rate = max_rate
+        self.max_texts = max_texts
+        self.max_bytes = max_bytes
+        self.request_count = 0
+        self.throttled_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._request_times: T.Deque[float] = collections.deque()
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._create_handler()
+        )
+        self._thread: T.Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2/translate"
+
+    def __enter__(self) -> "FakeDeepLServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_args: T.Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def _create_handler(self) -> T.Type[http.server.BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # keep the connections alive like the real api does
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:  # pylint: disable=invalid-name
+                length = int(self.headers.get("Content-Length", 0))
+                status, headers, body = server.handle(
+                    self.path, self.rfile.read(length)
+                )
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args: T.Any) -> None:
+                pass
+
+        return Handler
+
+    def _is_throttled(self, now: float) -> bool:
+        while self._request_times and self._request_times[0] < now - 1:
+            self._request_times.popleft()
+        if self.max_rate and len(self._request_times) >= self.max_rate:
+            return True
+        self._request_times.append(now)
+        return False
+
+    def handle(
+        self, path: str, body: bytes
+    ) -> T.Tuple[int, T.Dict[str, str], bytes]:
+        if path != "/v2/translate":
+            return 404, {}, b""
+        if len(body) > self.max_bytes:
+            return 413, {}, b""
+        form = urllib.parse.parse_qs(body.decode(), keep_blank_values=True)
+        if form.get("auth_key") != [self.api_key]:
+            return 403, {}, b""
+        texts = form.get("text", [])
+        if not texts or len(texts) > self.max_texts:
+            return 400, {}, b""
+
+        with self._lock:
+            self.request_count += 1
+            throttled = self._is_throttled(time.monotonic())
+            if throttled:
+                self.throttled_count += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+        if throttled:
+            return 429, {"Retry-After": "1"}, b""
+
+        time.sleep(delay)
+        source_code = form.get("source_lang", [""])[0]
+        target_code = form.get("target_lang", [""])[0]
+        response = {
+            "translations": [
+                {
+                    "detected_source_language": source_code,
+                    "text": fake_translate(text, target_code),
+                }
+                for text in texts
+            ]
+        }
+        return (
+            200,
+            {"Content-Type": "application/json"},
+            json.dumps(response).encode(),
+        )
+
+
+class FakeLog:
+    def __init__(self) -> None:
+        self.messages: T.List[T.Tuple[str, str]] = []
+
+    def info(self, text: str) -> None:
+        self.messages.append(("info", text))
+
+    def warn(self, text: str) -> None:
+        self.messages.append(("warn", text))
+
+    def error(self, text: str) -> None:
+        self.messages.append(("error", text))
+
+
+def create_command(
+    tmp_path: Path,
+    server: FakeDeepLServer,
+    subtitles: T.List[AssEvent],
+    undo_capture: T.Callable[[], T.ContextManager[None]] = (
+        contextlib.nullcontext
+    ),
+    **kwargs: T.Any,
+) -> GoogleTranslateCommand:
+    async def get_subtitles() -> T.List[AssEvent]:
+        return subtitles
+
+    api = SimpleNamespace(
+        log=FakeLog(),
+        undo=SimpleNamespace(capture=undo_capture),
+        cfg=SimpleNamespace(
+            opt={
+                "plugins": {
+                    "deepl_api_key": server.api_key,
+                    "deepl_api_url": server.url,
+                    "tl_memory_path": tmp_path / "memory.sqlite",
+                }
+            }
+        ),
+    )
+    # the pipeline only needs the api and the parsed arguments
+    command = GoogleTranslateCommand.__new__(GoogleTranslateCommand)
+    command.api = api
+    command.args = argparse.Namespace(
+        **{
+            "target": SimpleNamespace(get_subtitles=get_subtitles),
+            "engine": "deepl",
+            "source_code": "ja",
+            "target_code": "en",
+            "max_workers": 4,
+            "rate": None,
+            "timeout": 30,
+            "refresh": False,
+            "resume": False,
+            **kwargs,
+        }
+    )
+    return command
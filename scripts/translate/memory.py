@@ -0,0 +1,92 @@
+import sqlite3
+import typing as T
+from pathlib import Path
+
+# sqlite's default limit on the number of query parameters is 999
+QUERY_SIZE = 500
+
+
+class TranslationMemory:
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "engine TEXT NOT NULL, "
+            "source_code TEXT NOT NULL, "
+            "target_code TEXT NOT NULL, "
+            "chunk TEXT NOT NULL, "
+            "translation TEXT NOT NULL, "
+            "PRIMARY KEY (engine, source_code, target_code, chunk))"
+        )
+        # what the adaptive batching settled on last time
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS engine_parameters ("
+            "engine TEXT NOT NULL PRIMARY KEY, "
+            "batch_size REAL NOT NULL, "
+            "rate REAL NOT NULL)"
+        )
+
+    def get_many(
+        self,
+        engine: str,
+        source_code: str,
+        target_code: str,
+        chunks: T.Iterable[str],
+    ) -> T.Dict[str, str]:
+        unique_chunks = list(dict.fromkeys(chunks))
+        result: T.Dict[str, str] = {}
+        for i in range(0, len(unique_chunks), QUERY_SIZE):
+            query_chunks = unique_chunks[i : i + QUERY_SIZE]
+            placeholders = ", ".join("?" for _ in query_chunks)
+            result.update(
+                self._conn.execute(
+                    "SELECT chunk, translation FROM translations "
+                    "WHERE engine = ? AND source_code = ? "
+                    f"AND target_code = ? AND chunk IN ({placeholders})",
+                    (engine, source_code, target_code, *query_chunks),
+                )
+            )
+        self.hits += len(result)
+        self.misses += len(unique_chunks) - len(result)
+        return result
+
+    def put_many(
+        self,
+        engine: str,
+        source_code: str,
+        target_code: str,
+        translations: T.Iterable[T.Tuple[str, str]],
+    ) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                (
+                    (engine, source_code, target_code, chunk, translation)
+                    for chunk, translation in translations
+                ),
+            )
+
+    def get_engine_parameters(
+        self, engine: str
+    ) -> T.Optional[T.Tuple[float, float]]:
+        return self._conn.execute(
+            "SELECT batch_size, rate FROM engine_parameters WHERE engine = ?",
+            (engine,),
+        ).fetchone()
+
+    def put_engine_parameters(
+        self, engine: str, batch_size: float, rate: float
+    ) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO engine_parameters VALUES (?, ?, ?)",
+                (engine, batch_size, rate),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
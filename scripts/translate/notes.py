@@ -0,0 +1,113 @@
+import collections
+import typing as T
+
+import ass_tag_parser
+from ass_parser import AssEvent
+
+
+class ParsedNote(T.NamedTuple):
+    event: AssEvent
+    # ass tags at the even indices, kept as they are, and text to translate
+    # at the odd ones
+    parts: T.List[str]
+
+
+def preprocess(chunk: str) -> str:
+    # collapse the whitespace too, so that chunks differing only in that
+    # are translated once
+    return " ".join(chunk.replace("\\N", " ").split())
+
+
+def postprocess(chunk: str) -> str:
+    return (
+        chunk.replace("...", "…")
+        .replace(" !", "!")
+        .replace(" ?", "?")
+        .replace(" …", "…")
+    )
+
+
+def parse_note(event: AssEvent) -> ParsedNote:
+    text = event.note
+    try:
+        ass_line = ass_tag_parser.parse_ass(text)
+    except ass_tag_parser.ParseError:
+        return ParsedNote(event, ["", text] if text else [""])
+    parts = [""]
+    for item in ass_line:
+        if isinstance(item, ass_tag_parser.AssText) and item.text:
+            parts += [item.text, ""]
+        else:
+            parts[-1] += item.meta.text
+    return ParsedNote(event, parts)
+
+
+def parse_notes(events: T.Iterable[AssEvent]) -> T.List[ParsedNote]:
+    return list(map(parse_note, events))
+
+
+def collect_text_chunks(notes: T.Iterable[ParsedNote]) -> T.Iterable[str]:
+    for note in notes:
+        yield from note.parts[1::2]
+
+
+def translate_chunk(chunk: str, translations: T.Mapping[str, str]) -> str:
+    # the translations are keyed by the preprocessed chunk, which loses the
+    # whitespace around it, such as the space between a closing tag and the
+    # next word; put it back
+    text = chunk.replace("\\N", " ").replace("\n", " ")
+    if not text.strip():
+        return text
+    leading = text[: len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()) :]
+    return leading + postprocess(translations[preprocess(chunk)]) + trailing
+
+
+def translate_note(note: ParsedNote, translations: T.Mapping[str, str]) -> str:
+    parts = note.parts.copy()
+    for i in range(1, len(parts), 2):
+        parts[i] = translate_chunk(parts[i], translations)
+    text = "".join(parts)
+    # nothing worth appending to a line that only had whitespace
+    return text if text.strip() else ""
+
+
+def has_text(event: AssEvent, text: str) -> bool:
+    return text in event.text.split("\\N")
+
+
+def append_text(event: AssEvent, text: str) -> None:
+    if not text:
+        return
+    if event.text:
+        event.text += "\\N" + text
+    else:
+        event.text = text
+
+
+class NoteTracker:
+    # hands out the notes as soon as the translations of all their chunks
+    # are in
+    def __init__(self, notes: T.List[ParsedNote]) -> None:
+        self.notes = notes
+        self.done_count = 0
+        self._missing_counts: T.List[int] = []
+        self._waiting: T.Dict[str, T.List[int]] = collections.defaultdict(list)
+        self._ready: T.List[int] = []
+        for idx, note in enumerate(notes):
+            chunks = set(map(preprocess, note.parts[1::2]))
+            self._missing_counts.append(len(chunks))
+            for chunk in chunks:
+                self._waiting[chunk].append(idx)
+            if not chunks:
+                self._ready.append(idx)
+
+    def add(self, chunks: T.Iterable[str]) -> T.List[ParsedNote]:
+        ready, self._ready = self._ready, []
+        for chunk in chunks:
+            for idx in self._waiting.pop(chunk, []):
+                self._missing_counts[idx] -= 1
+                if not self._missing_counts[idx]:
+                    ready.append(idx)
+        self.done_count += len(ready)
+        return [self.notes[idx] for idx in sorted(ready)]
@@ -0,0 +1,33 @@
+import asyncio
+import time
+import typing as T
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1,
+        clock: T.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.last_update = clock()
+
+    def reserve(self) -> float:
+        # take a token right away, going into debt if there are none left,
+        # and return how long the caller needs to wait for it to be earned
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_update) * self.rate
+        )
+        self.last_update = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,41 @@
+from .adaptive import TARGET_LATENCY, AdaptiveController
+from .batching import EngineLimits
+
+LIMITS = EngineLimits(max_bytes=1000, max_segments=10, rate=1, max_rate=2)
+
+
+def test_adaptive_controller_increase() -> None:
+    controller = AdaptiveController(LIMITS)
+    assert (controller.max_segments, controller.rate) == (5, 1)
+    controller.on_success(latency=1)
+    assert (controller.max_segments, controller.rate) == (7, 1.2)
+    for _ in range(10):
+        controller.on_success(latency=1)
+    assert (controller.max_segments, controller.rate) == (10, 2)
+
+
+def test_adaptive_controller_slow_batches() -> None:
+    controller = AdaptiveController(LIMITS, batch_size=8)
+    controller.on_success(latency=TARGET_LATENCY + 1)
+    assert (controller.max_segments, controller.rate) == (4, 1)
+    for _ in range(5):
+        controller.on_success(latency=TARGET_LATENCY + 1)
+    assert controller.max_segments == 1
+
+
+def test_adaptive_controller_throttled() -> None:
+    controller = AdaptiveController(LIMITS, batch_size=8, rate=2)
+    controller.on_throttled(start_time=0, now=1)
+    assert (controller.max_segments, controller.rate) == (4, 1)
+    # sent before the first backoff took effect
+    controller.on_throttled(start_time=0.5, now=1.5)
+    assert (controller.max_segments, controller.rate) == (4, 1)
+    controller.on_throttled(start_time=2, now=3)
+    assert (controller.max_segments, controller.rate) == (2, 0.5)
+
+
+def test_adaptive_controller_fixed_rate() -> None:
+    controller = AdaptiveController(LIMITS, rate=1.5, adapt_rate=False)
+    controller.on_success(latency=1)
+    controller.on_throttled(start_time=0, now=1)
+    assert controller.rate == 1.5
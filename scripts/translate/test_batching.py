@@ -0,0 +1,40 @@
+import collections
+import typing as T
+
+from .batching import take_batch
+
+
+def take_batches(
+    chunks: T.List[str], max_bytes: int, max_segments: int
+) -> T.List[T.List[str]]:
+    remaining_chunks = collections.deque(chunks)
+    batches = []
+    while remaining_chunks:
+        batches.append(take_batch(remaining_chunks, max_bytes, max_segments))
+    return batches
+
+
+def test_take_batch_by_size() -> None:
+    assert take_batches(["abc", "def", "ghi", "j"], 10, 100) == [
+        ["abc", "def"],
+        ["ghi", "j"],
+    ]
+    # counts bytes rather than characters
+    assert take_batches(["はい", "はい"], 10, 100) == [["はい"], ["はい"]]
+
+
+def test_take_batch_by_segments() -> None:
+    assert take_batches(list("abcde"), 1000, 2) == [
+        ["a", "b"],
+        ["c", "d"],
+        ["e"],
+    ]
+
+
+def test_take_batch_oversized_chunk() -> None:
+    assert take_batches(["a", "abcdefgh", "b"], 5, 100) == [
+        ["a"],
+        ["abcdefgh"],
+        ["b"],
+    ]
+    assert not take_batch(collections.deque(), 5, 100)
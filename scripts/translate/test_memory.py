@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from .memory import QUERY_SIZE, TranslationMemory
+
+
+def test_translation_memory(tmp_path: Path) -> None:
+    path = tmp_path / "memory.sqlite"
+    memory = TranslationMemory(path)
+    assert memory.get_many("google", "ja", "en", ["はい"]) == {}
+    memory.put_many("google", "ja", "en", [("はい", "Yes"), ("え?", "Eh?")])
+    memory.close()
+
+    memory = TranslationMemory(path)
+    assert memory.get_many("google", "ja", "en", ["はい", "え?", "x"]) == {
+        "はい": "Yes",
+        "え?": "Eh?",
+    }
+    assert memory.get_many("deepl", "ja", "en", ["はい"]) == {}
+    assert memory.get_many("google", "ja", "pl", ["はい"]) == {}
+    assert memory.get_many("google", "auto", "en", ["はい"]) == {}
+    assert (memory.hits, memory.misses) == (2, 4)
+
+
+def test_translation_memory_many_chunks(tmp_path: Path) -> None:
+    memory = TranslationMemory(tmp_path / "memory.sqlite")
+    chunks = [str(i) for i in range(QUERY_SIZE * 2 + 1)]
+    memory.put_many("google", "ja", "en", ((chunk, chunk) for chunk in chunks))
+    assert len(memory.get_many("google", "ja", "en", chunks + chunks)) == len(
+        chunks
+    )
+    assert memory.misses == 0
+
+
+def test_engine_parameters(tmp_path: Path) -> None:
+    path = tmp_path / "memory.sqlite"
+    memory = TranslationMemory(path)
+    assert memory.get_engine_parameters("deepl") is None
+    memory.put_engine_parameters("deepl", 12.5, 3.0)
+    memory.close()
+
+    memory = TranslationMemory(path)
+    assert memory.get_engine_parameters("deepl") == (12.5, 3.0)
+    assert memory.get_engine_parameters("google") is None
@@ -0,0 +1,94 @@
+from ass_parser import AssEvent
+
+from .notes import (
+    NoteTracker,
+    append_text,
+    collect_text_chunks,
+    has_text,
+    parse_notes,
+    postprocess,
+    preprocess,
+    translate_note,
+)
+
+
+def test_preprocess() -> None:
+    assert preprocess(r"Eh?\Nwhat") == "Eh? what"
+    assert preprocess(" Eh?\n") == preprocess("Eh?") == "Eh?"
+    assert preprocess("a  b\tc") == "a b c"
+    assert preprocess("  ") == ""
+
+
+def test_postprocess() -> None:
+    assert postprocess("Wait ... what ?") == "Wait… what?"
+
+
+def test_parse_notes() -> None:
+    notes = parse_notes(
+        [
+            AssEvent(note=r"{\i1}one{\b1}{\i0}two"),
+            AssEvent(note="three"),
+            AssEvent(note=""),
+            AssEvent(note="{unclosed"),
+        ]
+    )
+    assert [note.parts for note in notes] == [
+        [r"{\i1}", "one", r"{\b1}{\i0}", "two", ""],
+        ["", "three", ""],
+        [""],
+        ["", "{unclosed"],
+    ]
+    assert list(collect_text_chunks(notes)) == [
+        "one",
+        "two",
+        "three",
+        "{unclosed",
+    ]
+
+
+def test_translate_note() -> None:
+    (note,) = parse_notes([AssEvent(note=r"{\i1}one ...{\b1}{\i0}two\Nthree")])
+    translations = {"one ...": "ONE ...", "two three": "TWO THREE"}
+    assert (
+        translate_note(note, translations) == r"{\i1}ONE…{\b1}{\i0}TWO THREE"
+    )
+
+
+def test_translate_note_keeps_whitespace() -> None:
+    text = r"{\i1}Hello{\i0} world, {\b1}friend{\b0}! {\i1}\Nbye"
+    (note,) = parse_notes([AssEvent(note=text)])
+    chunks = map(preprocess, collect_text_chunks([note]))
+    translations = {chunk: chunk for chunk in chunks}
+    assert translate_note(note, translations) == (
+        r"{\i1}Hello{\i0} world, {\b1}friend{\b0}! {\i1} bye"
+    )
+    (note,) = parse_notes([AssEvent(note=r" \N ")])
+    assert translate_note(note, {}) == ""
+
+
+def test_append_text() -> None:
+    event = AssEvent(text="")
+    append_text(event, "")
+    assert event.text == ""
+    append_text(event, "one")
+    append_text(event, "two")
+    assert event.text == r"one\Ntwo"
+    assert has_text(event, "two")
+    assert not has_text(event, "three")
+
+
+def test_note_tracker() -> None:
+    notes = parse_notes(
+        [
+            AssEvent(note=r"a{\i1}b"),
+            AssEvent(note="c"),
+            AssEvent(note=""),
+            AssEvent(note="a  a"),
+        ]
+    )
+    tracker = NoteTracker(notes)
+    assert tracker.add(["b"]) == [notes[2]]
+    assert tracker.add(["x", "a"]) == [notes[0]]
+    assert tracker.add(["a a", "c"]) == [notes[1], notes[3]]
+    assert tracker.add(["b", "a"]) == []
+    assert tracker.done_count == 4
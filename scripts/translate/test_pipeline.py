@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import typing as T
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+from ass_parser import AssEvent
+
+from . import MAX_THROTTLED, translate_deepl
+from .fake import FakeDeepLServer, create_command
+from .memory import TranslationMemory
+
+
+def get_api(url: str) -> T.Any:
+    return SimpleNamespace(
+        cfg=SimpleNamespace(
+            opt={"plugins": {"deepl_api_key": "fake", "deepl_api_url": url}}
+        )
+    )
+
+
+def test_translate_deepl() -> None:
+    with FakeDeepLServer(latency=0, jitter=0) as server:
+        with requests.Session() as session:
+            assert translate_deepl(
+                get_api(server.url), ["a", "b"], "ja", "en", session, 10
+            ) == ["[EN] a", "[EN] b"]
+
+
+def test_translate_deepl_timeout() -> None:
+    with FakeDeepLServer(latency=1, jitter=0) as server:
+        with requests.Session() as session:
+            with pytest.raises(TimeoutError):
+                translate_deepl(
+                    get_api(server.url), ["a"], "ja", "en", session, 0.1
+                )
+
+
+def test_translate_deepl_connection_error() -> None:
+    # a port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/v2/translate"
+    with requests.Session() as session:
+        with pytest.raises(TimeoutError):
+            translate_deepl(get_api(url), ["a"], "ja", "en", session, 10)
+
+
+def test_run_gives_up_after_timeouts(tmp_path: Path) -> None:
+    subtitles = [AssEvent(note=f"line {idx}") for idx in range(3)]
+    with FakeDeepLServer(latency=1, jitter=0) as server:
+        command = create_command(
+            tmp_path, server, subtitles, max_workers=1, rate=100, timeout=0.1
+        )
+        asyncio.run(command.run())
+        # the same batch went back into the queue after every timeout
+        assert server.request_count == MAX_THROTTLED
+
+    messages = command.api.log.messages
+    assert [level for level, _text in messages].count("warn") == (
+        MAX_THROTTLED - 1
+    )
+    assert ("error", "error (deepl timed out)") in messages
+    assert messages[-1] == (
+        "info",
+        "0/3 lines translated, run again with --resume to translate the rest",
+    )
+    assert not any(subtitle.text for subtitle in subtitles)
+    # a failed run doesn't leave its cut down parameters behind
+    memory = TranslationMemory(tmp_path / "memory.sqlite")
+    try:
+        assert memory.get_engine_parameters("deepl") is None
+    finally:
+        memory.close()
+
+
+def test_run(tmp_path: Path) -> None:
+    subtitles = [AssEvent(note=f"line {idx % 2}") for idx in range(3)]
+    with FakeDeepLServer(latency=0, jitter=0) as server:
+        command = create_command(tmp_path, server, subtitles)
+        asyncio.run(command.run())
+        assert server.request_count == 1
+    assert [subtitle.text for subtitle in subtitles] == [
+        "[EN] line 0",
+        "[EN] line 1",
+        "[EN] line 0",
+    ]
+    assert command.api.log.messages[-1] == ("info", "OK")
+    memory = TranslationMemory(tmp_path / "memory.sqlite")
+    try:
+        assert memory.get_engine_parameters("deepl") is not None
+    finally:
+        memory.close()
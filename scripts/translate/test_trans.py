@@ -0,0 +1,56 @@
+import sys
+import typing as T
+from pathlib import Path
+
+import pytest
+
+from .trans import TransError, translate_trans
+
+
+def get_args(tmp_path: Path, source: str) -> T.List[str]:
+    path = tmp_path / "fake_trans.py"
+    path.write_text(source)
+    return [sys.executable, str(path)]
+
+
+UPPER = """
+import sys
+for line in sys.argv[-1].split("\\n"):
+    print(line.upper())
+"""
+
+
+def test_translate_trans(tmp_path: Path) -> None:
+    args = get_args(tmp_path, UPPER)
+    assert translate_trans(args, ["a", "b"], timeout=10) == ["A", "B"]
+    assert translate_trans(args, ["c"], timeout=10) == ["C"]
+
+
+def test_translate_trans_timeout(tmp_path: Path) -> None:
+    args = get_args(tmp_path, "import time; time.sleep(60)")
+    with pytest.raises(TimeoutError):
+        translate_trans(args, ["a"], timeout=0.1)
+
+
+def test_translate_trans_error(tmp_path: Path) -> None:
+    args = get_args(tmp_path, "import sys; sys.exit('no network')")
+    with pytest.raises(TransError, match="no network"):
+        translate_trans(args, ["a"], timeout=10)
+
+
+def test_translate_trans_mismatching_lines(tmp_path: Path) -> None:
+    # translates the first line only
+    args = get_args(tmp_path, "import sys; print(sys.argv[-1].split()[0])")
+    assert translate_trans(args, ["a"], timeout=10) == ["a"]
+    with pytest.raises(TransError):
+        translate_trans(args, ["a", "b"], timeout=10)
+
+
+def test_translate_trans_keeps_blank_lines(tmp_path: Path) -> None:
+    args = get_args(tmp_path, UPPER)
+    assert translate_trans(args, ["a", " ", "b"], timeout=10) == [
+        "A",
+        " ",
+        "B",
+    ]
+    assert translate_trans(args, [""], timeout=10) == [""]
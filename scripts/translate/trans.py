@@ -0,0 +1,60 @@
+import subprocess
+import typing as T
+
+
+class TransError(ValueError):
+    pass
+
+
+def get_trans_args(
+    engine: str, source_code: str, target_code: str
+) -> T.List[str]:
+    args = ["trans", "-b", "-no-ansi"]
+    args += ["-e", engine]
+    args += ["-s", source_code]
+    args += ["-t", target_code]
+    return args
+
+
+def translate_trans(
+    args: T.List[str], lines: T.List[str], timeout: float
+) -> T.List[str]:
+    # a fresh process and a single request per batch: the chunks go
+    # newline-joined as one text and come back one per line. there's no
+    # pool of long-lived processes, since trans' interactive mode sends a
+    # request per line rather than per batch, and runs lines starting with
+    # ":" as commands. blank chunks produce no output line, so keep them as
+    # they are
+    indices = [i for i, line in enumerate(lines) if line.strip()]
+    results = list(lines)
+    if not indices:
+        return results
+
+    try:
+        result = subprocess.run(
+            args + ["\n".join(lines[i] for i in indices)],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise TimeoutError("trans timed out") from None
+    except subprocess.CalledProcessError as ex:
+        raise TransError(
+            f"trans exited with {ex.returncode} ({ex.stderr.strip()})"
+        ) from None
+
+    translated_lines = (
+        result.stdout.replace("\u200b", "").strip("\n").split("\n")
+    )
+    # a chunk that got split or dropped would shift every later result
+    if len(translated_lines) != len(indices):
+        raise TransError(
+            f"trans returned {len(translated_lines)} lines "
+            f"for {len(indices)} chunks"
+        )
+    for i, translated_line in zip(indices, translated_lines):
+        results[i] = translated_line
+    return results